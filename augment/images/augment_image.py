@@ -1,148 +1,605 @@
 import os
+import time
+import bisect
 import cv2
 from tqdm import tqdm
 from pathlib import Path
-from core.config_data import get_image_config
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from core.metrics import metrics
 from core.utils import get_current_time, create_new_directory, get_parent_directory, get_parent_directory
-from core.utils import get_basename, replicate_directory_structure, count_similar_folders
-from augment.images.processor_image import ImageProcessor
+from core.utils import get_basename, allocate_version, find_latest_version_folder
+from core.utils import get_workers_count, split_into_chunks, hash_files
+from augment.images.processor_image import ImageProcessor, MULTI_IMAGE_OPERATIONS
+from augment.images.photometric import sample_rng
+from augment.images.pipeline_plan import load_image_plan, compile_steps
+from augment.images.image_header import read_image_size
+from augment.images.output_writer import FolderWriter
+from augment.images.shard_writer import ShardWriter, seal_shards
+from augment.images.tensor_writer import TensorWriter, TensorStore
+from augment.images.batch_processor import augment_batch
+from augment.images.image_cache import DecodedImageCache
+from augment.images.manifest import Manifest, get_pair_stat, get_pair_config
+from augment.images.preprocess_cache import PreprocessCache, EVICT_CHUNKS
+from augment.images.dataset_scanner import find_splits, iter_split_pairs
+from augment.images.dedup import find_duplicates, write_dedup_report
+from augment.images.dataset_index import update_dataset_index
+from augment.images.class_balance import read_class_names, plan_class_balance, write_class_balance_report
 
 
 class AugmentImageDataset():
-    def __init__(self, data_path, classes_path):
+    def __init__(self, data_path, classes_path, plan=None, output_path=None, incremental=False):
         self.data_path = data_path
         self.classes_path = classes_path
-        self.new_data_path = self.create_new_dataset_folder()
+        self.plan = plan if plan is not None else load_image_plan()
+        self.incremental = incremental
+        self.new_data_path = self.get_output_folder(output_path)
         self.all_data = self.preprocess()
         self.process_dataset()
         
 
     # Preprocessing
     def preprocess(self):
-        tmp_all_data = {}
-        for subdir in os.listdir(self.data_path):
-            subdir_path = os.path.join(self.data_path, subdir)
-            if not os.path.isdir(subdir_path):
-                continue
-            data_dict = self.process_subdirectory(subdir_path)
-            if data_dict:
-                tmp_all_data[subdir] = data_dict
-        return tmp_all_data
-
-
-    def process_subdirectory(self, subdir_path):
-        images_path = os.path.join(subdir_path, 'images')
-        labels_path = os.path.join(subdir_path, 'labels')
-        if not os.path.exists(images_path) or not os.path.exists(labels_path):
-            return
-        data_dict = self.create_data_dict(images_path, labels_path)
-        self.remove_unpaired_files(data_dict, images_path, labels_path)
-        return data_dict
-
-
-    def create_data_dict(self, images_path, labels_path):
-        image_files = os.listdir(images_path)
-        label_files = os.listdir(labels_path)
-        data_dict = {}
-        for f in image_files:
-            basename, ext = os.path.splitext(f)
-            if basename not in data_dict:
-                data_dict[basename] = {'image': None, 'label': None}
-            data_dict[basename]['image'] = Path(images_path) / f
-        for f in label_files:
-            basename, ext = os.path.splitext(f)
-            if basename not in data_dict:
-                data_dict[basename] = {'image': None, 'label': None}
-            data_dict[basename]['label'] = Path(labels_path) / f
-        return data_dict
-    
-
-    
-    def remove_unpaired_files(self, data_dict, images_path, labels_path):
-        for basename, files in data_dict.items():
-            if files['image'] is None and files['label'] is not None:
-                label_file_path = os.path.join(labels_path, files['label'])
-                os.remove(label_file_path)
-            elif files['label'] is None and files['image'] is not None:
-                image_file_path = os.path.join(images_path, files['image'])
-                os.remove(image_file_path)
+        # splits and their pairs are discovered lazily while the pipeline consumes them
+        for split_path in find_splits(self.data_path):
+            key = os.path.relpath(split_path, self.data_path)
+            yield key, iter_split_pairs(split_path)
 
 
 
     # processing
     def process_dataset(self):
-        for key, sub_dict in self.all_data.items():
-            for sub_key, value in tqdm(sub_dict.items(), desc=f"Processing folder {key}"):
-                ap = AugmentProcessor(image_path=value['image'], 
-                                      annotation_path=value['label'],
-                                      save_folder_path=self.new_data_path)
-        
+        workers = get_workers_count(self.plan.workers)
+        config = self.plan.fingerprint
+        manifest = Manifest(self.new_data_path)
+        metrics.enabled = self.plan.metrics
+        self.prometheus_time = time.monotonic()
+        self.finished_chunks = 0
+        self.tensor = None
+        if self.plan.output_format == 'tensor':
+            width, height = self.plan.output_size
+            self.tensor = TensorStore(self.new_data_path, height=height, width=width)
+            manifest.discard_uncommitted(self.tensor.base)
+        # header sizes and boxes of every pair, refreshed for the pairs that changed since the last run
+        self.index = update_dataset_index(self.data_path, workers) if self.plan.dataset_index else None
+        # near-duplicates of a kept image are skipped or only get the basic augmentation
+        self.dedup_report = {}
+        # images with only frequent classes get fewer augmentations
+        self.class_names = read_class_names(self.classes_path) if self.plan.class_balance else None
+        self.class_balance_report = {}
+        failed = []
+        try:
+            for key, pairs in self.all_data:
+                if self.plan.output_format == 'folders':
+                    self.create_split_folders(key)
+                duplicates = {}
+                if self.plan.dedup != 'off' or self.plan.class_balance or self.plan.multi_image:
+                    pairs = list(pairs)
+                # composites draw their partners from every pair of the split, not only the pending ones
+                pool = get_split_pool(pairs, self.plan)
+                if pool is not None:
+                    # in pool order the partners of a sample were preprocessed just before it
+                    pairs = pool
+                if self.plan.dedup != 'off':
+                    duplicates = self.find_split_duplicates(key, pairs, workers)
+                selected = {}
+                if self.plan.class_balance:
+                    selected = self.plan_split_balance(key, pairs)
+                with tqdm(desc=f"Processing folder {key}", unit='pair') as pbar:
+                    tasks = self.get_tasks(pairs, manifest, config, pbar, duplicates, selected, pool)
+                    if workers > 1:
+                        results = self.process_parallel(tasks, workers, pbar)
+                    else:
+                        results = self.process_serial(tasks, pbar)
+                    for task, error, digest in results:
+                        if error is not None:
+                            failed.append((task['image'], error))
+                            tqdm.write(f"Failed {task['image']}: {error}")
+                        else:
+                            manifest.record(task['key'], task['stat'], digest, task['config'],
+                                            [step.name for step in task.get('augmentations', self.plan.augmentations)],
+                                            task.get('slot'))
+                    manifest.flush()
+                if self.plan.cache_dir:
+                    PreprocessCache(self.plan.cache_dir, self.plan.cache_size_mb).evict()
+        finally:
+            # the serial path wrote through this process' writer
+            failed.extend(close_worker_writer())
+            clear_worker_image_cache()
+            if self.plan.output_format == 'shards':
+                seal_shards(self.new_data_path)
+            if self.tensor is not None:
+                self.tensor.finalize()
+            manifest.close()
+            if self.plan.dedup != 'off':
+                write_dedup_report(os.path.join(self.new_data_path, 'dedup_report.json'),
+                                   self.plan.dedup, self.plan.dedup_distance, self.dedup_report)
+            if self.plan.class_balance:
+                write_class_balance_report(os.path.join(self.new_data_path, 'class_balance_report.json'),
+                                           dict(self.plan.class_weights or ()), self.class_balance_report)
+            if self.plan.metrics:
+                self.export_metrics()
+        if failed:
+            print(f"Failed to process {len(failed)} pairs")
+        return failed
+
+
+    def export_metrics(self):
+        metrics.write_summary(self.plan.metrics_path or os.path.join(self.new_data_path, 'metrics.json'))
+        if self.plan.prometheus_path:
+            metrics.write_prometheus(self.plan.prometheus_path)
+
+
+    def find_split_duplicates(self, key, pairs, workers):
+        image_paths = [image_path for image_path, annotation_path in pairs]
+        duplicates = find_duplicates(image_paths, self.plan.dedup_distance, workers)
+        self.dedup_report[key] = (len(image_paths),
+                                  {os.path.relpath(duplicate, self.data_path): os.path.relpath(kept, self.data_path)
+                                   for duplicate, kept in duplicates.items()})
+        tqdm.write(f"Folder {key}: {len(duplicates)} of {len(image_paths)} images are near-duplicates "
+                   f"({'skipped' if self.plan.dedup == 'skip' else 'basic only'})")
+        return duplicates
+
+
+    def plan_split_balance(self, key, pairs):
+        keys = [os.path.relpath(image_path, self.data_path) for image_path, annotation_path in pairs]
+        selected, stats = plan_class_balance(pairs, keys, self.plan.augmentations, self.class_names,
+                                             dict(self.plan.class_weights or ()), self.index, self.data_path)
+        self.class_balance_report[key] = stats
+        outputs = sum(copies * images for copies, images in enumerate(stats['images_by_copies']))
+        tqdm.write(f"Folder {key}: class balance keeps {outputs} of {len(pairs) * len(self.plan.augmentations)} outputs, "
+                   f"{len(selected)} of {len(pairs)} images get fewer augmentations")
+        return selected
+
+
+    def get_tasks(self, pairs, manifest, config, pbar, duplicates=None, selected=None, pool=None):
+        duplicates = duplicates or {}
+        selected = selected or {}
+        basic = compile_steps(['basic'], {})
+        for image_path, annotation_path in pairs:
+            augmentations = selected.get(image_path)
+            if image_path in duplicates:
+                if self.plan.dedup == 'skip':
+                    pbar.update(1)
+                    continue
+                augmentations = basic
+            if augmentations is not None and not augmentations:
+                # the class balance left nothing to write for this pair
+                pbar.update(1)
+                continue
+            key = os.path.relpath(image_path, self.data_path)
+            stat = get_pair_stat(image_path, annotation_path)
+            partners = None
+            if pool is not None:
+                partners = draw_partners(image_path, key, pool, augmentations or self.plan.augmentations)
+                # composites change with their partners, so the partners' files count as the pair's own
+                for partner_pairs in partners.values():
+                    for partner_pair in partner_pairs:
+                        stat = stat + get_pair_stat(*partner_pair)
+            pair_config = get_pair_config(config, augmentations)
+            if manifest.is_current(key, stat, pair_config):
+                pbar.update(1)
+                continue
+            task = {'key': key, 'image': image_path, 'label': annotation_path, 'stat': stat,
+                    'digest': manifest.get_digest(key, pair_config), 'config': pair_config}
+            if augmentations is not None:
+                # overrides plan.augmentations for this pair
+                task['augmentations'] = augmentations
+            # outputs of augmentations the pair had before but no longer gets are removed
+            names = [step.name for step in (augmentations or self.plan.augmentations)]
+            dropped = [name for name in manifest.get_augmentations(key) or () if name not in names]
+            if dropped:
+                task['dropped'] = dropped
+            if partners is not None:
+                task['partners'] = partners
+            size = self.index.get_size(key) if self.index is not None else None
+            if size is not None:
+                task['size'] = size
+            if self.tensor is not None:
+                # every augmentation of the pair gets its own row
+                task['slot'] = self.tensor.reserve(len(task.get('augmentations', self.plan.augmentations)))
+            yield task
+
+
+    def process_serial(self, tasks, pbar):
+        for chunk in split_into_chunks(tasks, self.plan.chunk_size):
+            yield from self._finish_chunk(*process_chunk(chunk, self.data_path, self.new_data_path, self.plan), pbar)
+
+
+    def process_parallel(self, tasks, workers, pbar):
+        chunks = split_into_chunks(tasks, self.plan.chunk_size)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(process_chunk, chunk, self.data_path, self.new_data_path, self.plan))
+                # keep a bounded number of chunks in flight
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._collect_chunks(done, pbar)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._collect_chunks(done, pbar)
+
+
+    def _collect_chunks(self, futures, pbar):
+        for future in futures:
+            yield from self._finish_chunk(*future.result(), pbar)
+
+
+    def _finish_chunk(self, results, snapshot, pbar):
+        pbar.update(len(results))
+        self.finished_chunks += 1
+        # workers only add to the cache, the main process keeps it near cache_size_mb while the run goes
+        if self.plan.cache_dir and self.finished_chunks % EVICT_CHUNKS == 0:
+            PreprocessCache(self.plan.cache_dir, self.plan.cache_size_mb).evict()
+        if self.plan.metrics:
+            metrics.merge(snapshot)
+            # long runs refresh the Prometheus textfile while they go
+            if self.plan.prometheus_path and time.monotonic() - self.prometheus_time >= self.plan.prometheus_interval:
+                metrics.write_prometheus(self.plan.prometheus_path)
+                self.prometheus_time = time.monotonic()
+        return results
+
 
 
     # new dataset folder
+    def get_output_folder(self, output_path):
+        if not self.incremental:
+            return self.create_new_dataset_folder()
+        if output_path is None:
+            path = Path(self.data_path)
+            output_path = find_latest_version_folder(get_parent_directory(path), get_basename(path))
+            if output_path is None:
+                return self.create_new_dataset_folder()
+        # an explicit output folder may be anywhere, a new one is started there
+        os.makedirs(output_path, exist_ok=True)
+        return str(output_path)
+
+
     def create_new_dataset_folder(self):
         path = Path(self.data_path)
         parent_dir = get_parent_directory(path)
         base_name = get_basename(path)
         timestamp = get_current_time()
-        version = count_similar_folders(parent_dir, base_name)
+        version = allocate_version(parent_dir, base_name)
         new_dir_name = f"{base_name}-V{version}-{timestamp}"
         new_dir_path = os.path.join(parent_dir, new_dir_name)
         
         create_new_directory(new_dir_path)
-        replicate_directory_structure(path, new_dir_path)
         return new_dir_path
 
 
+    def create_split_folders(self, key):
+        # output folders are created per split when it is reached, not by mirroring the input tree
+        for folder in ('images', 'labels'):
+            os.makedirs(os.path.join(self.new_data_path, key, folder), exist_ok=True)
+
+
+#--------------------------------------------------------Workers--------------------------------------------------------
+worker_writer = None
+worker_writer_root = None
+worker_image_cache = None
+
+
+def init_worker():
+    # each worker is single threaded, parallelism comes from the pool
+    cv2.setNumThreads(1)
+    # a forked worker must not report the counters the main process already merged
+    metrics.collect()
+
+
+def get_worker_writer(plan, save_folder_path):
+    global worker_writer, worker_writer_root
+    if worker_writer is not None and worker_writer_root == save_folder_path:
+        return worker_writer
+    close_worker_writer()
+    if plan.output_format == 'shards':
+        worker_writer = ShardWriter(root=save_folder_path, max_bytes=plan.shard_size_mb * 1024 * 1024,
+                                    prefix=f"w{os.getpid()}")
+    elif plan.output_format == 'tensor':
+        width, height = plan.output_size
+        worker_writer = TensorWriter(root=save_folder_path, height=height, width=width, prefix=f"w{os.getpid()}")
+    else:
+        worker_writer = FolderWriter(threads=plan.writer_threads, queue_size=plan.writer_queue_size,
+                                     link=plan.passthrough == 'link')
+    worker_writer_root = save_folder_path
+    return worker_writer
+
+
+def get_worker_image_cache(plan):
+    # preprocessed images by path, valid for one plan; cleared at the end of the run
+    global worker_image_cache
+    if worker_image_cache is None:
+        worker_image_cache = DecodedImageCache(plan.image_cache_mb)
+    return worker_image_cache
+
+
+def clear_worker_image_cache():
+    global worker_image_cache
+    worker_image_cache = None
+
+
+def close_worker_writer():
+    global worker_writer, worker_writer_root
+    if worker_writer is None:
+        return []
+    errors = worker_writer.close()
+    worker_writer, worker_writer_root = None, None
+    return errors
+
+
+def process_pair(task, data_path, save_folder_path, plan, writer=None, augment=True, partners=None):
+    processor = None
+    try:
+        digest = hash_files([task['image'], task['label']])
+        # composites change with their partners, the recorded digest covers the partners' files too
+        partner_files = [path for pairs in task.get('partners', {}).values() for pair in pairs for path in pair]
+        record_digest = f"{digest}:{hash_files(partner_files)}" if partner_files else digest
+        # touched but unchanged pairs keep their outputs
+        if record_digest == task['digest']:
+            metrics.add('pairs_unchanged')
+            return None, record_digest, None
+        with metrics.timer('pair'):
+            processor = AugmentProcessor(image_path=task['image'],
+                                         annotation_path=task['label'],
+                                         data_path=data_path,
+                                         save_folder_path=save_folder_path,
+                                         plan=plan,
+                                         writer=writer,
+                                         digest=digest,
+                                         augment=augment,
+                                         partners=partners,
+                                         augmentations=task.get('augmentations'),
+                                         source_size=task.get('size'))
+            processor.ip.remove_augmentations(task.get('dropped', ()))
+    except Exception as e:
+        metrics.add('pairs_failed')
+        return f"{type(e).__name__}: {e}", None, None
+    metrics.add('pairs_processed')
+    return None, record_digest, processor
+
+
+def process_chunk(chunk, data_path, save_folder_path, plan):
+    metrics.enabled = plan.metrics
+    writer = get_worker_writer(plan, save_folder_path)
+    partners = get_chunk_partners({task['image']: task['partners'] for task in chunk if 'partners' in task},
+                                  data_path, save_folder_path, plan)
+    if plan.batch_size > 1:
+        results = process_chunk_batched(chunk, data_path, save_folder_path, plan, writer, partners)
+    else:
+        results = []
+        for task in chunk:
+            writer.begin_sample(task['key'], task.get('slot'))
+            error, digest, processor = process_pair(task, data_path, save_folder_path, plan, writer, partners=partners)
+            results.append((task, error, digest))
+    # writes of the chunk finish before it is reported, so the manifest never gets ahead of the disk
+    write_errors = dict(writer.flush())
+    results = [(task, error or write_errors.get(task['key']), digest) for task, error, digest in results]
+    return results, metrics.collect()
+
+
+def process_chunk_batched(chunk, data_path, save_folder_path, plan, writer, partners=None):
+    # preprocess every pair first, then augment same-shaped images together
+    results, processors = [], []
+    for task in chunk:
+        writer.begin_sample(task['key'], task.get('slot'))
+        error, digest, processor = process_pair(task, data_path, save_folder_path, plan, writer,
+                                                augment=False, partners=partners)
+        results.append([task, error, digest])
+        if processor is not None:
+            processors.append((results[-1], processor))
+
+    for batch in split_into_chunks(processors, plan.batch_size):
+        try:
+            with metrics.timer('batch_augment'):
+                batched = augment_batch([processor.ip for result, processor in batch],
+                                        [processor.augmentations for result, processor in batch])
+        except Exception as e:
+            for result, processor in batch:
+                result[1] = f"{type(e).__name__}: {e}"
+            continue
+        for (result, processor), outputs in zip(batch, batched):
+            task = result[0]
+            writer.begin_sample(task['key'], task.get('slot'))
+            try:
+                processor.processing_batched_augmentation(outputs)
+            except Exception as e:
+                result[1] = f"{type(e).__name__}: {e}"
+    return [tuple(result) for result in results]
+
+
+def draw_partners(image_path, key, pool, augmentations):
+    """
+    Partners of one sample for every composite in augmentations: {operation: [(image path, annotation path), ...]}.
+    pool is the sorted pair list of the whole split, partners come from the partner_window pairs on either side
+    of the sample, so a sample processed in pool order finds most of them still in the decoded-image cache.
+    The draws depend only on the key, the pool and augmentation_seed, whatever chunk or resumed run the sample is in.
+    """
+    position = bisect.bisect_left(pool, (str(image_path),))
+    own = position if position < len(pool) and pool[position][0] == str(image_path) else None
+    draws = {}
+    for step in augmentations:
+        count = MULTI_IMAGE_OPERATIONS.get(step.name)
+        if count is None:
+            continue
+        window = step.kwargs['partner_window']
+        # the window keeps its width at the ends of the pool
+        start = min(max(position - window, 0), max(len(pool) - 2 * window - 1, 0))
+        stop = min(start + 2 * window + 1, len(pool))
+        candidates = stop - start - (own is not None)
+        if not candidates:
+            # a split of one image can only be combined with itself
+            draws[step.name] = [pool[own]] * count
+            continue
+        rng = sample_rng(key, f"{step.name}_partners", step.kwargs['augmentation_seed'])
+        picks = start + rng.choice(candidates, size=count, replace=candidates < count)
+        if own is not None:
+            picks[picks >= own] += 1
+        draws[step.name] = [pool[index] for index in picks.tolist()]
+    return draws
+
+
+def get_split_pool(pairs, plan):
+    # the pairs partners are drawn from, None when the plan has no composites
+    if not plan.multi_image:
+        return None
+    return sorted((str(image_path), str(annotation_path)) for image_path, annotation_path in pairs)
+
+
+def get_chunk_partners(draws, data_path, save_folder_path, plan):
+    # draws: {image path: draw_partners of the sample} for the samples of the chunk
+    if not plan.multi_image:
+        return None
+    return PartnerSource(draws, data_path, save_folder_path, plan)
+
+
+class PartnerSource:
+    # serves the drawn partners of a chunk; partners are preprocessed on first use and kept in the
+    # worker's decoded-image cache, which lives across the chunks of a run
+    def __init__(self, draws, data_path, save_folder_path, plan):
+        self.draws = {str(image_path): partners for image_path, partners in draws.items()}
+        self.pairs = {image_path: annotation_path for partners in self.draws.values()
+                      for pairs in partners.values() for image_path, annotation_path in pairs}
+        self.data_path = data_path
+        self.save_folder_path = save_folder_path
+        self.plan = plan
+        self.cache = get_worker_image_cache(plan)
+
+
+    def sample(self, image_path, operation):
+        return [self.get(partner_path) for partner_path, annotation_path in self.draws[str(image_path)][operation]]
+
+
+    def get(self, image_path):
+        cached = self.cache.get(image_path)
+        if cached is not None:
+            return cached
+        metrics.add('partners_decoded')
+        processor = AugmentProcessor(image_path=image_path,
+                                     annotation_path=self.pairs[image_path],
+                                     data_path=self.data_path,
+                                     save_folder_path=self.save_folder_path,
+                                     plan=self.plan,
+                                     augment=False,
+                                     partners=self)
+        return processor.ip.image, processor.ip.ap.annotation
+
+
+    def remember(self, image_path, image, annotation):
+        self.cache.put(str(image_path), image, annotation)
+
+
 #--------------------------------------------------------Processor------------------------------------------------------
 class AugmentProcessor():
-    def __init__(self, image_path, annotation_path, save_folder_path):
+    def __init__(self, image_path, annotation_path, data_path, save_folder_path, plan, writer=None, digest=None, augment=True,
+                 partners=None, augmentations=None, source_size=None):
         self.image_path = image_path
         self.annotation_path = annotation_path
+        self.plan = plan
+        self.augmentations = augmentations if augmentations is not None else plan.augmentations
+        # header size from the dataset index, saves reading the header again
+        self.source_size = source_size
+        self.writer = writer
         
         self.save_folder_path = save_folder_path
-        self.image_folder_type = self._get_relative_difference(current_path = self.image_path, save_path=self.save_folder_path)
-        self.annotation_folder_type = self._get_relative_difference(current_path = self.annotation_path, save_path=self.save_folder_path)
+        # outputs keep the folders of the pair inside the dataset, wherever the output folder is
+        self.image_folder_type = os.path.relpath(os.path.dirname(self.image_path), data_path)
+        self.annotation_folder_type = os.path.relpath(os.path.dirname(self.annotation_path), data_path)
+        # the same key as the task and the manifest, seeds the draws of the sample
+        self.sample_key = os.path.relpath(self.image_path, data_path)
         
         self.save_image_path = Path(self.save_folder_path) / self.image_folder_type
         self.save_annotation_path = Path(self.save_folder_path) / self.annotation_folder_type
 
 
-        ip = ImageProcessor(image_path=self.image_path,
-                            annotation_path=self.annotation_path,
-                            save_image_path=self.save_image_path,
-                            save_annotation_path=self.save_annotation_path)
+        # a mosaic or mixup of an earlier sample of the chunk may have preprocessed this image already
+        self.partners = partners
+        cached = partners.cache.get(str(image_path)) if partners is not None else None
 
+        # preprocessed base images are shared between runs that only differ in augmentations
+        self.cache, self.cache_key = None, None
+        if cached is None and self.plan.cache_dir and self.plan.preprocessing and digest is not None \
+                and not self.plan.randomized_preprocessing:
+            self.cache = PreprocessCache(self.plan.cache_dir, self.plan.cache_size_mb)
+            self.cache_key = self.cache.get_key(digest, self.plan.preprocessing_fingerprint)
+            cached = self.cache.get(self.cache_key)
+            metrics.add('cache_hits' if cached is not None else 'cache_misses')
 
-        self.function_mapping = {
-            'basic': ip.preprocessing_save_image,
-            'resize_image': ip.change_size_image,
-            'crop_image': ip.crop_image,
-            'flip_horizontal': ip.flip_horizontal_image,
-            'flip_vertical': ip.flip_vertical_image,
-            'flip_both':ip.flip_both_image
-        }
+        self.preprocessed = cached is not None
+        if self.preprocessed:
+            image, annotation = cached
+            self.ip = self._get_image_processor(image=image, annotation=annotation)
+        else:
+            self.ip = self._get_image_processor()
+            if not self._is_pure_passthrough():
+                # decoding is timed on its own, not inside the first operation that needs the pixels
+                self.ip.load()
 
-        self.processing_augmentation()
+        if augment:
+            self.processing_augmentation()
+        else:
+            self.processing_preprocessing()
         
 
-    def _get_relative_difference(self, current_path, save_path):
-        current_path = Path(current_path)
-        save_path = Path(save_path)
-        common_parts_length = len([part1 for part1, part2 in zip(current_path.parts, save_path.parts) if part1 == part2])
-        relative_path = str(Path(*current_path.parts[common_parts_length:]))
-        parts = relative_path.split(os.sep)
-        return get_parent_directory(str(os.path.join(*parts[1:])))
-    
+    def _get_image_processor(self, image=None, annotation=None):
+        decode_scale, source_size = 1, None
+        # the header is read only when the plan starts with a resize the decoder can take over
+        if image is None and self.plan.decode_resize is not None:
+            source_size = self.source_size or read_image_size(self.image_path)
+            if source_size is not None:
+                decode_scale = self.plan.decode_scale(*source_size)
+
+        return ImageProcessor(image_path=self.image_path,
+                              annotation_path=self.annotation_path,
+                              save_image_path=self.save_image_path,
+                              save_annotation_path=self.save_annotation_path,
+                              decode_scale=decode_scale,
+                              source_size=source_size if decode_scale > 1 else None,
+                              writer=self.writer,
+                              image=image,
+                              annotation=annotation,
+                              partners=self.partners,
+                              passthrough=self._can_pass_through(),
+                              sample_key=self.sample_key)
+
+
+    def _can_pass_through(self):
+        # without preprocessing the basic output is the source pair, writers that take files copy it as is
+        return self.plan.passthrough != 'off' and not self.plan.preprocessing \
+            and hasattr(self.writer, 'write_file')
+
+
+
+    def _is_pure_passthrough(self):
+        # every output is a copy of the source pair, the pixels and boxes are never needed
+        return self.ip.passthrough and self.partners is None \
+            and all(step.name == 'basic' for step in self.augmentations)
+
+
     #processing
+    def processing_preprocessing(self):
+        if not self.preprocessed:
+            for step in self.plan.preprocessing:
+                getattr(self.ip, step.method)(preprocess=True, **step.kwargs)
+            if self.cache is not None:
+                self.cache.put(self.cache_key, self.ip.image, self.ip.ap.annotation)
+            self.preprocessed = True
+        if self.partners is not None:
+            self.partners.remember(self.image_path, self.ip.image, self.ip.ap.annotation)
+
+
     def processing_augmentation(self):
-        config_data = get_image_config()
-        preprocessing = config_data["preprocessing"]
-        augmentations = config_data["augmentations"]
-        for prepare in preprocessing:
-            self.function_mapping[prepare](preprocess=True, **config_data)
-        for augmentation in augmentations:
-            self.function_mapping[augmentation](preprocess=False, **config_data)
+        self.processing_preprocessing()
+        for step in self.augmentations:
+            getattr(self.ip, step.method)(preprocess=False, **step.kwargs)
+
+
+    def processing_batched_augmentation(self, outputs):
+        # outputs: {step position: (image, boxes)} from augment_batch, other steps run per image
+        for position, step in enumerate(self.augmentations):
+            if position in outputs and not (step.name == 'basic' and self.ip.passthrough):
+                self.ip.save_augmentation(step.name, *outputs[position])
+            else:
+                getattr(self.ip, step.method)(preprocess=False, **step.kwargs)
 
     
     
@@ -0,0 +1,129 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from core.utils import get_workers_count, split_into_chunks, hash_files, get_parent_directory, get_basename
+from augment.images.augment_image import AugmentProcessor, init_worker, get_chunk_partners, get_split_pool, draw_partners
+from augment.images.augment_image import clear_worker_image_cache
+from augment.images.pipeline_plan import load_image_plan
+from augment.images.preprocess_cache import PreprocessCache, EVICT_CHUNKS
+from augment.images.dataset_scanner import find_splits, iter_split_pairs
+
+
+class MemoryWriter:
+    # collects the outputs of one pair instead of writing them; the k-th image goes with the k-th label
+    def __init__(self, augmentations):
+        self.augmentations = augmentations
+        self.key = None
+        self.images = []
+        self.annotations = []
+
+
+    def begin_sample(self, key, slot=None):
+        self.key = key
+        self.images = []
+        self.annotations = []
+
+
+    def write_image(self, path, image):
+        self.images.append(image)
+
+
+    def write_annotation(self, path, boxes):
+        self.annotations.append(boxes)
+
+
+    def collect(self):
+        return [(image, boxes, self.key, augmentation)
+                for image, boxes, augmentation in zip(self.images, self.annotations, self.augmentations)]
+
+
+def augment_chunk(chunk, data_path, save_folder_path, plan):
+    writer = MemoryWriter([step.name for step in plan.augmentations])
+    samples, errors = [], []
+    partners = get_chunk_partners({image_path: draws for key, image_path, annotation_path, draws in chunk},
+                                  data_path, save_folder_path, plan)
+    for key, image_path, annotation_path, draws in chunk:
+        writer.begin_sample(key)
+        try:
+            digest = hash_files([image_path, annotation_path]) if plan.cache_dir else None
+            AugmentProcessor(image_path=image_path,
+                             annotation_path=annotation_path,
+                             data_path=data_path,
+                             save_folder_path=save_folder_path,
+                             plan=plan,
+                             writer=writer,
+                             digest=digest,
+                             partners=partners)
+        except Exception as e:
+            errors.append((image_path, f"{type(e).__name__}: {e}"))
+            continue
+        samples.extend(writer.collect())
+    return samples, errors
+
+
+def iter_augmented(data_path=None, plan=None, workers=None, prefetch=2):
+    """
+    Runs the plan's preprocessing and augmentations in memory, nothing is written to disk.
+    Yields (image, boxes, sample_name, augmentation) in dataset order: image is a BGR uint8 array,
+    boxes an (N, 5) float32 YOLO array and sample_name the image path relative to data_path.
+    With workers > 1 up to workers * prefetch chunks are augmented ahead of the consumer.
+    Broken pairs are reported and skipped, unpaired files are left in place.
+    """
+    plan = plan if plan is not None else load_image_plan()
+    data_path = data_path if data_path is not None else plan.data_path
+    workers = get_workers_count(plan.workers if workers is None else workers)
+    # outputs are named as if they were saved next to the dataset, only the names are used
+    save_folder_path = os.path.join(get_parent_directory(os.path.abspath(data_path)),
+                                    f"{get_basename(os.path.abspath(data_path))}-memory")
+    chunks = split_into_chunks(iter_samples(data_path, plan), plan.chunk_size)
+
+    if workers <= 1:
+        try:
+            for finished, chunk in enumerate(chunks, 1):
+                yield from _finish_chunk(*augment_chunk(chunk, data_path, save_folder_path, plan), plan, finished)
+        finally:
+            # the partners of this process belong to this plan
+            clear_worker_image_cache()
+            _evict_cache(plan)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        pending = deque()
+        finished = 0
+        for chunk in chunks:
+            pending.append(executor.submit(augment_chunk, chunk, data_path, save_folder_path, plan))
+            # chunks come back in submission order, so the stream matches a serial run
+            if len(pending) >= workers * prefetch:
+                finished += 1
+                yield from _finish_chunk(*pending.popleft().result(), plan, finished)
+        while pending:
+            finished += 1
+            yield from _finish_chunk(*pending.popleft().result(), plan, finished)
+    _evict_cache(plan)
+
+
+def iter_samples(data_path, plan):
+    # (name, image path, annotation path, partner draws) in dataset order
+    for split_path in find_splits(data_path):
+        pairs = iter_split_pairs(split_path, remove_unpaired=False)
+        if plan.multi_image:
+            pairs = list(pairs)
+        pool = get_split_pool(pairs, plan)
+        for image_path, annotation_path in pool if pool is not None else pairs:
+            key = os.path.relpath(image_path, data_path)
+            draws = draw_partners(image_path, key, pool, plan.augmentations) if pool is not None else None
+            yield key, image_path, annotation_path, draws
+
+
+def _finish_chunk(samples, errors, plan, finished):
+    for image_path, error in errors:
+        print(f"Failed {image_path}: {error}")
+    # a stream has no end of split, the cache is kept near cache_size_mb every few chunks
+    if finished % EVICT_CHUNKS == 0:
+        _evict_cache(plan)
+    return samples
+
+
+def _evict_cache(plan):
+    if plan.cache_dir:
+        PreprocessCache(plan.cache_dir, plan.cache_size_mb).evict()
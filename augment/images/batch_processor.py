@@ -0,0 +1,64 @@
+import numpy as np
+from augment.images.yolo_boxes import BOX_COLUMNS
+
+# augmentations with NHWC batch kernels: name -> (flip horizontal, flip vertical)
+BATCH_OPERATIONS = {
+    'basic': (False, False),
+    'flip_horizontal': (True, False),
+    'flip_vertical': (False, True),
+    'flip_both': (True, True),
+}
+
+
+#boxes
+def pad_boxes(annotations):
+    counts = np.array([len(annotation) for annotation in annotations], dtype=np.int64)
+    boxes = np.zeros((len(annotations), int(counts.max(initial=0)), BOX_COLUMNS), dtype=np.float32)
+    for index, annotation in enumerate(annotations):
+        boxes[index, :len(annotation)] = annotation
+    return boxes, counts
+
+
+def flip_padded_boxes(boxes, horizontal, vertical):
+    flipped = boxes.copy()
+    # padding rows are flipped too, they are cut off again by the per-sample counts
+    if horizontal:
+        flipped[..., 1] = 1.0 - flipped[..., 1]
+    if vertical:
+        flipped[..., 2] = 1.0 - flipped[..., 2]
+    np.clip(flipped[..., 1:3], 0, 1, out=flipped[..., 1:3])
+    return flipped
+
+
+#images
+def flip_images(batch, horizontal, vertical):
+    if not horizontal and not vertical:
+        return batch
+    view = batch[:, ::-1 if vertical else 1, ::-1 if horizontal else 1]
+    # one contiguous copy for the whole batch, every sample is then a contiguous view for the encoder
+    return np.ascontiguousarray(view)
+
+
+def augment_batch(processors, steps):
+    """
+    Applies the batchable augmentation steps to preprocessed ImageProcessors, steps[i] belongs to processors[i].
+    Images of the same shape and steps are stacked into one NHWC batch per step.
+    Returns one {step position: (image, boxes)} dict per processor; steps without a batch kernel are left out.
+    """
+    results = [{} for _ in processors]
+    groups = {}
+    for index, (processor, processor_steps) in enumerate(zip(processors, steps)):
+        groups.setdefault((processor.image.shape, processor_steps), []).append(index)
+
+    for (shape, group_steps), indices in groups.items():
+        batch = np.stack([processors[index].image for index in indices])
+        boxes, counts = pad_boxes([processors[index].ap.annotation for index in indices])
+        for position, step in enumerate(group_steps):
+            if step.name not in BATCH_OPERATIONS:
+                continue
+            horizontal, vertical = BATCH_OPERATIONS[step.name]
+            images = flip_images(batch, horizontal, vertical)
+            new_boxes = flip_padded_boxes(boxes, horizontal, vertical)
+            for row, index in enumerate(indices):
+                results[index][position] = (images[row], new_boxes[row, :counts[row]])
+    return results
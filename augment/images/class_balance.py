@@ -0,0 +1,146 @@
+import os
+import json
+import hashlib
+import numpy as np
+from augment.images.yolo_boxes import read_yolo
+
+# fixed-point rounds of the per-class copy factors
+BALANCE_ROUNDS = 20
+
+
+#classes
+def read_class_names(classes_path):
+    # one name per line, the line number is the class id; None when there is no classes file
+    if not classes_path:
+        return None
+    try:
+        with open(classes_path, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError:
+        return None
+
+
+def get_class_weights(class_weights, class_names, count):
+    """
+    Target share of every class id. class_weights maps class names or ids to weights,
+    classes that are not listed get 1, None means equal shares.
+    """
+    weights = np.ones(count)
+    for name, weight in (class_weights or {}).items():
+        if class_names is not None and name in class_names:
+            class_id = class_names.index(name)
+        else:
+            try:
+                class_id = int(name)
+            except (TypeError, ValueError):
+                raise ValueError(f"Unknown class '{name}' in class_weights, expected a name from classes.txt or an id")
+        if not 0 <= class_id < count:
+            raise ValueError(f"Class id {class_id} in class_weights is out of range [0, {count})")
+        if weight < 0:
+            raise ValueError(f"Class weight must not be negative, got {weight} for '{name}'")
+        weights[class_id] = weight
+    return weights
+
+
+def read_image_classes(pairs, index=None, data_path=None):
+    # class ids of the boxes of every pair, from the dataset index when it has the pair
+    classes = []
+    for image_path, annotation_path in pairs:
+        boxes = index.get_boxes(os.path.relpath(image_path, data_path)) if index is not None else None
+        if boxes is None:
+            try:
+                boxes = read_yolo(annotation_path)
+            except (OSError, ValueError):
+                # broken labels fail later in the pipeline, here they only count as empty
+                boxes = np.zeros((0, 1), dtype=np.float32)
+        classes.append(boxes[:, 0].astype(np.int64))
+    return classes
+
+
+#plan
+def get_copy_counts(image_classes, weights, min_copies, max_copies, keys):
+    """
+    Number of outputs in [min_copies, max_copies] for every image, so that the box counts of the classes
+    after augmentation come close to shares proportional to weights.
+    Every class aims at the count of the most frequent class scaled by its weight, but a class c
+    with n_c boxes can reach at most max_copies * n_c. Each class gets a copy factor, an image takes the
+    largest factor of its classes: rare classes pull their images up, images with only frequent classes stay low.
+    The factors are corrected for the frequent boxes that ride along until the counts settle.
+    Fractional counts are rounded up or down by a hash of the key, so every image keeps its count between runs.
+    """
+    count = len(weights)
+    box_images = np.repeat(np.arange(len(image_classes)), [len(classes) for classes in image_classes])
+    box_classes = np.concatenate(image_classes) if image_classes else np.zeros(0, dtype=np.int64)
+    if len(box_classes) and (box_classes.min() < 0 or box_classes.max() >= count):
+        raise ValueError(f"Labels have class ids outside [0, {count}), check classes_txt_path")
+    boxes = np.bincount(box_classes, minlength=count).astype(np.float64)
+    present = (boxes > 0) & (weights > 0)
+    copies = np.full(len(image_classes), float(min_copies))
+    if not present.any():
+        return np.full(len(image_classes), min_copies, dtype=np.int64), boxes, boxes * min_copies
+    # the most frequent class (relative to its weight) sets the level, the others grow towards it
+    level = (max(min_copies, 1) * boxes[present] / weights[present]).max()
+    targets = np.where(present, np.minimum(weights * level, max_copies * boxes), boxes * min_copies)
+    factors = np.clip(np.divide(targets, boxes, out=np.zeros(count), where=boxes > 0), min_copies, max_copies)
+    for _ in range(BALANCE_ROUNDS):
+        copies = np.full(len(image_classes), float(min_copies))
+        np.maximum.at(copies, box_images, factors[box_classes])
+        reached = np.bincount(box_classes, weights=copies[box_images], minlength=count)
+        correction = np.divide(targets, reached, out=np.ones(count), where=reached > 0)
+        factors = np.clip(factors * correction, min_copies, max_copies)
+    fractions = np.array([int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') / 2 ** 64
+                          for key in keys])
+    counts = np.clip(np.floor(copies + fractions), min_copies, max_copies).astype(np.int64)
+    expected = np.bincount(box_classes, weights=counts[box_images], minlength=count)
+    return counts, boxes, expected
+
+
+def select_augmentations(augmentations, copies, key):
+    """
+    The first copies augmentations of the plan, 'basic' always first when the plan has it.
+    The rest start at an offset taken from the key, so images that get fewer copies do not all get the same ones.
+    """
+    basic = tuple(step for step in augmentations if step.name == 'basic')
+    others = tuple(step for step in augmentations if step.name != 'basic')
+    selected = basic[:copies]
+    wanted = copies - len(selected)
+    if wanted > 0 and others:
+        offset = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big') % len(others)
+        rotated = others[offset:] + others[:offset]
+        selected += rotated[:wanted]
+    return selected
+
+
+def plan_class_balance(pairs, keys, augmentations, class_names=None, class_weights=None, index=None, data_path=None):
+    """
+    Augmentations of every pair: {image_path: steps} for the pairs that get fewer than all of them,
+    and split statistics (class names, boxes before, expected boxes after, image counts per copy number).
+    """
+    image_classes = read_image_classes(pairs, index, data_path)
+    seen = max((int(classes.max()) + 1 for classes in image_classes if len(classes)), default=0)
+    count = len(class_names) if class_names is not None else seen
+    weights = get_class_weights(class_weights, class_names, count)
+    min_copies = 1 if any(step.name == 'basic' for step in augmentations) else 0
+    counts, boxes, expected = get_copy_counts(image_classes, weights, min_copies, len(augmentations), keys)
+    selected = {}
+    for (image_path, annotation_path), key, copies in zip(pairs, keys, counts.tolist()):
+        if copies < len(augmentations):
+            selected[image_path] = select_augmentations(augmentations, copies, key)
+    names = class_names if class_names is not None else [str(class_id) for class_id in range(count)]
+    stats = {'classes': names,
+             'boxes': boxes.astype(np.int64).tolist(),
+             'expected_boxes': expected.astype(np.int64).tolist(),
+             'images_by_copies': np.bincount(counts, minlength=len(augmentations) + 1).tolist()}
+    return selected, stats
+
+
+def write_class_balance_report(path, class_weights, splits):
+    """splits: {split key: statistics of plan_class_balance}."""
+    report = {'class_weights': class_weights, 'splits': {}}
+    for key, stats in splits.items():
+        report['splits'][key] = {
+            'images_by_copies': stats['images_by_copies'],
+            'classes': {name: {'boxes': boxes, 'expected_boxes': expected}
+                        for name, boxes, expected in zip(stats['classes'], stats['boxes'], stats['expected_boxes'])}}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,149 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from core.metrics import metrics
+from core.utils import get_basename, get_parent_directory, split_into_chunks
+from augment.images.yolo_boxes import BOX_COLUMNS, read_yolo
+from augment.images.image_header import read_image_size
+from augment.images.manifest import get_pair_stat
+from augment.images.dataset_scanner import find_splits, iter_split_pairs
+
+INDEX_CHUNK_SIZE = 256
+
+
+class DatasetIndex:
+    """
+    Image sizes and parsed boxes of every pair of a dataset, stored column-wise.
+    Row i: keys[i] and labels[i] (paths relative to the dataset), stats[i] (get_pair_stat),
+    sizes[i] ((width, height) from the file header, -1 when unknown) and boxes[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, keys, labels, stats, sizes, offsets, boxes):
+        self.keys = keys
+        self.labels = labels
+        self.stats = stats
+        self.sizes = sizes
+        self.offsets = offsets
+        self.boxes = boxes
+        self.positions = {key: position for position, key in enumerate(keys.tolist())}
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def __contains__(self, key):
+        return key in self.positions
+
+
+    def get_size(self, key):
+        position = self.positions.get(key)
+        if position is None or self.sizes[position, 0] < 0:
+            return None
+        return tuple(int(side) for side in self.sizes[position])
+
+
+    def get_boxes(self, key):
+        position = self.positions.get(key)
+        if position is None:
+            return None
+        return self.boxes[self.offsets[position]:self.offsets[position + 1]]
+
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, keys=self.keys, labels=self.labels, stats=self.stats, sizes=self.sizes,
+                 offsets=self.offsets, boxes=self.boxes)
+        os.replace(tmp_path, path)
+
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['keys'], data['labels'], data['stats'], data['sizes'], data['offsets'], data['boxes'])
+
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows: (key, label, stat, size, boxes)
+        counts = [len(row[4]) for row in rows]
+        return cls(keys=np.array([row[0] for row in rows], dtype=str),
+                   labels=np.array([row[1] for row in rows], dtype=str),
+                   stats=np.array([row[2] for row in rows], dtype=np.int64).reshape(-1, 4),
+                   sizes=np.array([row[3] for row in rows], dtype=np.int32).reshape(-1, 2),
+                   offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                   boxes=np.concatenate([row[4] for row in rows]) if rows
+                   else np.zeros((0, BOX_COLUMNS), dtype=np.float32))
+
+
+def get_index_path(data_path):
+    # next to the dataset, like the version registry
+    data_path = os.path.abspath(data_path)
+    return os.path.join(get_parent_directory(data_path), f".{get_basename(data_path)}-index.npz")
+
+
+def load_dataset_index(data_path):
+    try:
+        return DatasetIndex.load(get_index_path(data_path))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def update_dataset_index(data_path, workers=1):
+    """
+    Brings the index of data_path up to date and returns it.
+    Pairs whose size and mtime did not change are reused, the rest is read in parallel:
+    image sizes come from the JPEG/PNG headers, nothing is decoded.
+    """
+    with metrics.timer('index_update'):
+        old = load_dataset_index(data_path)
+        reused, stale = [], []
+        for split_path in find_splits(data_path):
+            for image_path, label_path in iter_split_pairs(split_path, remove_unpaired=False):
+                key = os.path.relpath(image_path, data_path)
+                stat = get_pair_stat(image_path, label_path)
+                position = old.positions.get(key) if old is not None else None
+                if position is not None and old.stats[position].tolist() == stat:
+                    reused.append(position)
+                else:
+                    stale.append((key, os.path.relpath(label_path, data_path), image_path, label_path, stat))
+
+        metrics.add('index_rows_reused', len(reused))
+        if old is not None and not stale and len(reused) == len(old):
+            return old
+        rows = list(_get_rows(old, reused)) if old is not None else []
+        for chunk_rows in _index_chunks(stale, workers):
+            rows.extend(chunk_rows)
+        metrics.add('index_rows_read', len(rows) - len(reused))
+        index = DatasetIndex.from_rows(rows)
+        index.save(get_index_path(data_path))
+    return index
+
+
+def _get_rows(old, positions):
+    keys = old.keys.tolist()
+    for position in positions:
+        yield (keys[position], str(old.labels[position]), old.stats[position].tolist(),
+               tuple(old.sizes[position].tolist()), old.boxes[old.offsets[position]:old.offsets[position + 1]])
+
+
+def _index_chunks(pairs, workers):
+    chunks = split_into_chunks(pairs, INDEX_CHUNK_SIZE)
+    if workers <= 1:
+        for chunk in chunks:
+            yield index_pairs(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(index_pairs, chunks)
+
+
+def index_pairs(pairs):
+    rows = []
+    for key, label_key, image_path, label_path, stat in pairs:
+        try:
+            size = read_image_size(image_path) or (-1, -1)
+            boxes = read_yolo(label_path)
+        except (OSError, ValueError):
+            # unreadable pairs stay out of the index, consumers fall back to reading the files
+            continue
+        rows.append((key, label_key, stat, size, boxes))
+    return rows
@@ -0,0 +1,44 @@
+import os
+
+LABEL_SUFFIX = '.txt'
+
+
+def find_splits(data_path):
+    # any folder holding both images/ and labels/ is a split, at any depth
+    with os.scandir(data_path) as it:
+        subdirs = sorted(entry.path for entry in it if entry.is_dir())
+    names = {os.path.basename(path) for path in subdirs}
+    if 'images' in names and 'labels' in names:
+        yield data_path
+        return
+    for subdir in subdirs:
+        yield from find_splits(subdir)
+
+
+def iter_split_pairs(split_path, remove_unpaired=True):
+    images_path = os.path.join(split_path, 'images')
+    labels_path = os.path.join(split_path, 'labels')
+    image_suffixes = set()
+    with os.scandir(images_path) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            stem, suffix = os.path.splitext(entry.name)
+            image_suffixes.add(suffix)
+            label_path = os.path.join(labels_path, stem + LABEL_SUFFIX)
+            if os.path.exists(label_path):
+                yield entry.path, label_path
+            elif remove_unpaired:
+                os.remove(entry.path)
+    if remove_unpaired:
+        remove_unpaired_labels(labels_path, images_path, image_suffixes)
+
+
+def remove_unpaired_labels(labels_path, images_path, image_suffixes):
+    with os.scandir(labels_path) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            stem = os.path.splitext(entry.name)[0]
+            if not any(os.path.exists(os.path.join(images_path, stem + suffix)) for suffix in image_suffixes):
+                os.remove(entry.path)
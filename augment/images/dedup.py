@@ -0,0 +1,107 @@
+import json
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from core.metrics import metrics
+
+HASH_BITS = 64
+DEDUP_MODES = ('off', 'skip', 'basic')
+
+
+#perceptual hash
+def dhash_image(image_path):
+    """
+    64-bit difference hash: signs of the horizontal gradients of a 9x8 grayscale thumbnail.
+    Returns None when the image can not be read, such pairs are never treated as duplicates.
+    """
+    # the thumbnail is tiny, so the JPEG decoder may skip most of the pixels
+    image = cv2.imread(str(image_path), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    thumbnail = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def compute_hashes(image_paths, workers=1):
+    with metrics.timer('dedup_hash'):
+        if workers <= 1:
+            return [dhash_image(path) for path in image_paths]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(dhash_image, image_paths, chunksize=64))
+
+
+#index
+class HammingIndex:
+    # multi-index hashing: hashes within max_distance bits share at least one of max_distance + 1 blocks exactly
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        bounds = [HASH_BITS * block // blocks for block in range(blocks + 1)]
+        self.blocks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.tables = [{} for _ in self.blocks]
+        self.hashes = []
+
+
+    def add(self, value):
+        index = len(self.hashes)
+        self.hashes.append(value)
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            table.setdefault((value >> shift) & mask, []).append(index)
+        return index
+
+
+    def query(self, value):
+        candidates = set()
+        for table, (shift, mask) in zip(self.tables, self.blocks):
+            candidates.update(table.get((value >> shift) & mask, ()))
+        return [index for index in candidates if (self.hashes[index] ^ value).bit_count() <= self.max_distance]
+
+
+def cluster_hashes(hashes, max_distance):
+    """
+    {duplicate position: kept position} for hashes in order, None hashes are never duplicates.
+    A hash within max_distance bits of a kept hash is a duplicate of the earliest such one, any other is kept.
+    Only kept hashes are indexed, so a long run of near-identical frames costs one lookup per frame.
+    """
+    index = HammingIndex(max_distance)
+    kept, duplicates = [], {}
+    for position, value in enumerate(hashes):
+        if value is None:
+            continue
+        matches = index.query(value)
+        if matches:
+            duplicates[position] = kept[min(matches)]
+        else:
+            index.add(value)
+            kept.append(position)
+    return duplicates
+
+
+def find_duplicates(image_paths, max_distance, workers=1):
+    """
+    Groups near-identical images and returns {duplicate path: kept path}.
+    The first image of every cluster in image_paths order is kept, every duplicate is within max_distance of it.
+    """
+    hashes = compute_hashes(image_paths, workers)
+    with metrics.timer('dedup_cluster'):
+        clusters = cluster_hashes(hashes, max_distance)
+    duplicates = {image_paths[position]: image_paths[kept] for position, kept in clusters.items()}
+    metrics.add('dedup_duplicates', len(duplicates))
+    return duplicates
+
+
+#report
+def write_dedup_report(path, mode, max_distance, splits):
+    """splits: {split key: (image count, {duplicate: kept})} with paths relative to the dataset."""
+    report = {'mode': mode, 'max_distance': max_distance, 'splits': {}}
+    for key, (count, duplicates) in splits.items():
+        groups = {}
+        for duplicate, kept in duplicates.items():
+            groups.setdefault(kept, []).append(duplicate)
+        report['splits'][key] = {'images': count,
+                                 'duplicates': len(duplicates),
+                                 'clusters': [{'kept': kept, 'duplicates': sorted(items)}
+                                              for kept, items in sorted(groups.items())]}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,213 @@
+import os
+import time
+import cv2
+import numpy as np
+from core.utils import get_workers_count, get_parent_directory, get_basename
+from augment.images.processor_image import get_resize_shape
+from augment.images.pipeline_plan import load_image_plan
+from augment.images.yolo_boxes import BOX_COLUMNS, format_yolo
+from augment.images.dataset_index import update_dataset_index
+from augment.images.augment_image import AugmentProcessor, get_chunk_partners, get_split_pool, draw_partners
+
+# approximate tar overhead per member: 512 byte header, a PAX block for long names and the padding
+TAR_MEMBER_BYTES = 1024
+
+
+class MeasureWriter:
+    # keeps the outputs of a calibration pair in memory, nothing reaches the disk
+    def __init__(self):
+        self.images = []
+        self.annotations = []
+
+
+    def begin_sample(self, key, slot=None):
+        pass
+
+
+    def write_image(self, path, image):
+        self.images.append((path, image))
+
+
+    def write_annotation(self, path, boxes):
+        self.annotations.append(boxes)
+
+
+def get_step_size(step, width, height):
+    if step.name == 'fused_geometry':
+        for sub_step in step.kwargs['steps']:
+            width, height = get_step_size(sub_step, width, height)
+    elif step.name == 'resize_image':
+        width, height = get_resize_shape(width, height, **step.kwargs)
+    elif step.name == 'crop_image':
+        params = step.kwargs
+        width -= params['crop_left'] + params['crop_right']
+        height -= params['crop_top'] + params['crop_bottom']
+    return width, height
+
+
+def get_steps_size(steps, width, height):
+    for step in steps:
+        width, height = get_step_size(step, width, height)
+    return width, height
+
+
+class CostProfile:
+    # seconds per megapixel of input for every stage and encoded bytes per output pixel for every augmentation
+    def __init__(self):
+        self.seconds = {}
+        self.megapixels = {}
+        self.encoded_bytes = {}
+        self.pixels = {}
+        self.label_bytes = 0
+        self.boxes = 0
+        self.source_boxes = {}
+        self.output_boxes = {}
+
+
+    def add_time(self, stage, seconds, megapixels):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.megapixels[stage] = self.megapixels.get(stage, 0.0) + megapixels
+
+
+    def add_output(self, augmentation, encoded_bytes, pixels):
+        self.encoded_bytes[augmentation] = self.encoded_bytes.get(augmentation, 0) + encoded_bytes
+        self.pixels[augmentation] = self.pixels.get(augmentation, 0) + pixels
+
+
+    def add_labels(self, augmentation, source_boxes, labels):
+        self.source_boxes[augmentation] = self.source_boxes.get(augmentation, 0) + source_boxes
+        for boxes in labels:
+            self.output_boxes[augmentation] = self.output_boxes.get(augmentation, 0) + len(boxes)
+            self.label_bytes += len(format_yolo(boxes))
+            self.boxes += len(boxes)
+
+
+    def get_cost(self, stage):
+        megapixels = self.megapixels.get(stage, 0.0)
+        return self.seconds[stage] / megapixels if megapixels else 0.0
+
+
+    def get_bytes_per_pixel(self, augmentation):
+        pixels = self.pixels.get(augmentation, 0)
+        return self.encoded_bytes[augmentation] / pixels if pixels else 0.0
+
+
+    def get_box_factor(self, augmentation):
+        # crops drop boxes, composites add the partners' boxes
+        source_boxes = self.source_boxes.get(augmentation, 0)
+        return self.output_boxes.get(augmentation, 0) / source_boxes if source_boxes else 1.0
+
+
+    def get_bytes_per_box(self):
+        # a label line of the sample, used for every label of the run
+        return self.label_bytes / self.boxes if self.boxes else 0.0
+
+
+    def to_dict(self):
+        return {'seconds_per_megapixel': {stage: self.get_cost(stage) for stage in self.seconds},
+                'bytes_per_pixel': {name: self.get_bytes_per_pixel(name) for name in self.encoded_bytes},
+                'boxes_per_source_box': {name: self.get_box_factor(name) for name in self.source_boxes},
+                'bytes_per_box': self.get_bytes_per_box()}
+
+
+def calibrate(pairs, sizes, box_counts, plan, data_path, save_folder_path):
+    """Runs the plan on a few pairs with in-memory outputs and times every stage."""
+    profile = CostProfile()
+    # composites draw their partners from the calibration sample
+    pool = get_split_pool(pairs, plan)
+    draws = {image_path: draw_partners(image_path, os.path.relpath(image_path, data_path), pool, plan.augmentations)
+             for image_path, label_path in pairs} if pool else {}
+    partners = get_chunk_partners(draws, data_path, save_folder_path, plan)
+    for (image_path, label_path), (width, height), source_boxes in zip(pairs, sizes, box_counts):
+        writer = MeasureWriter()
+        start = time.perf_counter()
+        processor = AugmentProcessor(image_path=image_path, annotation_path=label_path, data_path=data_path,
+                                     save_folder_path=save_folder_path, plan=plan, writer=writer,
+                                     augment=False, partners=partners)
+        profile.add_time('preprocess', time.perf_counter() - start, width * height / 1e6)
+        image = processor.ip.image
+        megapixels = image.shape[0] * image.shape[1] / 1e6
+        for step in plan.augmentations:
+            outputs, labels = len(writer.images), len(writer.annotations)
+            start = time.perf_counter()
+            getattr(processor.ip, step.method)(preprocess=False, **step.kwargs)
+            profile.add_time(step.name, time.perf_counter() - start, megapixels)
+            for path, output in writer.images[outputs:]:
+                start = time.perf_counter()
+                ok, buffer = cv2.imencode(os.path.splitext(str(path))[1], output)
+                profile.add_time('encode', time.perf_counter() - start, output.shape[0] * output.shape[1] / 1e6)
+                profile.add_output(step.name, buffer.nbytes, output.shape[0] * output.shape[1])
+            profile.add_labels(step.name, source_boxes, writer.annotations[labels:])
+    return profile
+
+
+def estimate_run(data_path=None, plan=None, sample_size=8, workers=None):
+    """
+    Estimates files, bytes and time of a run without writing any output.
+    Image sizes and box counts come from the dataset index, costs from a calibration on sample_size pairs
+    spread over the dataset. Near-duplicate skipping and incremental runs are not taken into account.
+    """
+    plan = plan if plan is not None else load_image_plan()
+    data_path = data_path if data_path is not None else plan.data_path
+    workers = get_workers_count(plan.workers if workers is None else workers)
+
+    start = time.perf_counter()
+    index = update_dataset_index(data_path, workers)
+    index_seconds = time.perf_counter() - start
+    known = index.sizes[:, 0] >= 0
+    if not known.any():
+        raise ValueError(f"No image sizes could be read from the headers in {data_path}")
+    # images without a readable header are counted with the mean size
+    fallback = tuple(int(side) for side in index.sizes[known].mean(axis=0))
+    sizes = [tuple(size) if size[0] >= 0 else fallback for size in index.sizes.tolist()]
+
+    positions = sorted(set(np.linspace(0, len(index) - 1, min(sample_size, len(index))).astype(int).tolist()))
+    pairs = [(os.path.join(data_path, str(index.keys[position])), os.path.join(data_path, str(index.labels[position])))
+             for position in positions]
+    save_folder_path = os.path.join(get_parent_directory(os.path.abspath(data_path)),
+                                    f"{get_basename(os.path.abspath(data_path))}-dry-run")
+    box_counts = np.diff(index.offsets)
+    profile = calibrate(pairs, [sizes[position] for position in positions], box_counts[positions].tolist(),
+                        plan, data_path, save_folder_path)
+
+    # without preprocessing the basic output is a link or copy of the source
+    passthrough = plan.passthrough != 'off' and not plan.preprocessing and plan.output_format != 'tensor'
+    cpu_seconds = image_bytes = label_bytes = 0.0
+    output_sizes = {}
+    for position, (width, height) in enumerate(sizes):
+        cpu_seconds += profile.get_cost('preprocess') * width * height / 1e6
+        base_width, base_height = get_steps_size(plan.preprocessing, width, height)
+        base_megapixels = base_width * base_height / 1e6
+        for step in plan.augmentations:
+            out_width, out_height = get_step_size(step, base_width, base_height)
+            output_sizes[(out_width, out_height)] = output_sizes.get((out_width, out_height), 0) + 1
+            cpu_seconds += profile.get_cost(step.name) * base_megapixels
+            if step.name == 'basic' and passthrough:
+                image_bytes += index.stats[position, 0]
+                continue
+            if plan.output_format == 'tensor':
+                image_bytes += out_width * out_height * 3
+                continue
+            cpu_seconds += profile.get_cost('encode') * out_width * out_height / 1e6
+            image_bytes += profile.get_bytes_per_pixel(step.name) * out_width * out_height
+        boxes = sum(box_counts[position] * profile.get_box_factor(step.name) for step in plan.augmentations)
+        if plan.output_format == 'tensor':
+            label_bytes += boxes * BOX_COLUMNS * 4
+        else:
+            label_bytes += boxes * profile.get_bytes_per_box()
+
+    outputs = len(index) * len(plan.augmentations)
+    if plan.output_format == 'shards':
+        image_bytes += outputs * TAR_MEMBER_BYTES
+        label_bytes += outputs * TAR_MEMBER_BYTES
+    return {'data_path': data_path,
+            'pairs': len(index),
+            'pairs_without_header_size': int((~known).sum()),
+            'output_format': plan.output_format,
+            'outputs': {'images': outputs, 'labels': outputs},
+            'output_sizes': {f"{width}x{height}": count for (width, height), count in sorted(output_sizes.items())},
+            'bytes': {'images': int(image_bytes), 'labels': int(label_bytes), 'total': int(image_bytes + label_bytes)},
+            'time': {'index_s': index_seconds, 'cpu_s': cpu_seconds, 'workers': workers,
+                     # workers beyond the cores of this node do not shorten the run
+                     'wall_s': index_seconds + cpu_seconds / min(workers, os.cpu_count() or 1)},
+            'calibration': {'pairs': len(pairs), **profile.to_dict()}}
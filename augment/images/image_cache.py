@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from core.metrics import metrics
+
+
+class DecodedImageCache:
+    # preprocessed images and boxes kept in memory under a byte budget, least recently used go first
+    def __init__(self, size_mb=512):
+        self.max_bytes = int(size_mb * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.size = 0
+
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            metrics.add('image_cache_misses')
+            return None
+        self.entries.move_to_end(key)
+        metrics.add('image_cache_hits')
+        return entry
+
+
+    def put(self, key, image, annotation):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        # shared by several composites, so nobody may change them in place
+        image.setflags(write=False)
+        annotation.setflags(write=False)
+        self.entries[key] = (image, annotation)
+        self.size += image.nbytes + annotation.nbytes
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            old_image, old_annotation = self.entries.popitem(last=False)[1]
+            self.size -= old_image.nbytes + old_annotation.nbytes
+            metrics.add('image_cache_evictions')
+
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -0,0 +1,45 @@
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# SOF markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but do not
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_size(image_path):
+    with open(image_path, 'rb') as f:
+        head = f.read(24)
+        if head.startswith(PNG_SIGNATURE) and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if head.startswith(b'\xff\xd8'):
+            f.seek(2)
+            return _read_jpeg_size(f)
+    return None
+
+
+def _read_jpeg_size(f):
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        # standalone markers without a length field
+        if code == 0x01 or 0xD0 <= code <= 0xD9:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if code in JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>HH', frame[1:5])
+            return width, height
+        f.seek(length - 2, 1)
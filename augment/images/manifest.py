@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+class Manifest:
+    def __init__(self, dataset_path):
+        self.path = os.path.join(dataset_path, MANIFEST_NAME)
+        self.records = self.open_manifest(self.path)
+        self.file = open(self.path, 'a')
+
+
+    def open_manifest(self, path):
+        records = {}
+        if not os.path.exists(path):
+            return records
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a run killed mid-write leaves a truncated last line
+                    continue
+                records[record['key']] = record
+        return records
+
+
+    def is_current(self, key, stat, config):
+        record = self.records.get(key)
+        return record is not None and record['config'] == config and record['stat'] == stat
+
+
+    def get_digest(self, key, config):
+        record = self.records.get(key)
+        if record is None or record['config'] != config:
+            return None
+        return record['digest']
+
+
+    def get_augmentations(self, key):
+        # names of the augmentations the pair was last written with, None for older records
+        record = self.records.get(key)
+        return record.get('augmentations') if record is not None else None
+
+
+    def record(self, key, stat, digest, config, augmentations=None, slot=None):
+        record = {'key': key, 'stat': stat, 'digest': digest, 'config': config}
+        if augmentations is not None:
+            record['augmentations'] = augmentations
+        if slot is not None:
+            record['slot'] = slot
+        self.records[key] = record
+        self.file.write(json.dumps(record) + '\n')
+
+
+    def discard_uncommitted(self, committed_rows):
+        # tensor rows at or beyond committed_rows were lost with a killed run, their pairs are not done
+        self.records = {key: record for key, record in self.records.items()
+                        if record.get('slot', -1) < committed_rows}
+
+
+    def flush(self):
+        self.file.flush()
+
+
+    def close(self):
+        self.file.close()
+
+
+def get_pair_stat(image_path, annotation_path):
+    image_stat = os.stat(image_path)
+    annotation_stat = os.stat(annotation_path)
+    return [image_stat.st_size, image_stat.st_mtime_ns, annotation_stat.st_size, annotation_stat.st_mtime_ns]
+
+
+def get_pair_config(config, augmentations=None):
+    # a pair with its own augmentations is current only for that selection
+    if augmentations is None:
+        return config
+    names = ','.join(step.name for step in augmentations)
+    return hashlib.blake2b(f"{config}:{names}".encode(), digest_size=16).hexdigest()
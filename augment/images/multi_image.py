@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+from augment.images.yolo_boxes import clip_boxes, empty_boxes
+
+
+def mosaic(samples, width, height, rng):
+    """
+    Puts four (image, boxes) samples on a 2x2 grid of a width x height canvas.
+    The grid center is drawn from the middle half of the canvas, every sample is resized into its cell.
+    """
+    center_x = int(round(width * rng.uniform(0.25, 0.75)))
+    center_y = int(round(height * rng.uniform(0.25, 0.75)))
+    cells = ((0, 0, center_x, center_y),
+             (center_x, 0, width - center_x, center_y),
+             (0, center_y, center_x, height - center_y),
+             (center_x, center_y, width - center_x, height - center_y))
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    merged = []
+    for (image, boxes), (x, y, cell_width, cell_height) in zip(samples, cells):
+        canvas[y:y + cell_height, x:x + cell_width] = cv2.resize(image, (cell_width, cell_height),
+                                                                 interpolation=cv2.INTER_AREA)
+        moved = boxes.copy()
+        moved[:, 1] = (x + moved[:, 1] * cell_width) / width
+        moved[:, 2] = (y + moved[:, 2] * cell_height) / height
+        moved[:, 3] *= cell_width / width
+        moved[:, 4] *= cell_height / height
+        merged.append(moved)
+    return canvas, clip_boxes(np.concatenate(merged)) if merged else empty_boxes()
+
+
+def mixup(image, boxes, partner_image, partner_boxes, rng, alpha):
+    # the partner is stretched to the image size, so its normalized boxes stay valid
+    height, width = image.shape[:2]
+    if partner_image.shape[:2] != (height, width):
+        partner_image = cv2.resize(partner_image, (width, height), interpolation=cv2.INTER_AREA)
+    ratio = rng.beta(alpha, alpha)
+    blended = cv2.addWeighted(image, ratio, partner_image, 1 - ratio, 0)
+    return blended, clip_boxes(np.concatenate([boxes, partner_boxes]))
@@ -0,0 +1,139 @@
+import os
+import shutil
+import threading
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from core.metrics import metrics
+from augment.images.yolo_boxes import format_yolo
+
+
+class FolderWriter:
+    def __init__(self, threads=0, queue_size=32, link=False):
+        # write_file hardlinks the source when the filesystem allows it, otherwise copies it
+        self.link = link
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        # backpressure: producers block once queue_size writes are in flight
+        self.slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self.condition = threading.Condition()
+        self.pending = 0
+        self.errors = []
+        # key of the sample being written, failed writes are reported against it
+        self.owner = None
+
+
+    def begin_sample(self, key, slot=None):
+        self.owner = key
+
+
+    def write_image(self, path, image):
+        self._submit(self._write_image, path, image)
+
+
+    def write_annotation(self, path, boxes):
+        self._submit(self._write_annotation, path, boxes)
+
+
+    def write_file(self, path, source_path):
+        self._submit(self._write_file, path, source_path)
+
+
+    def remove_output(self, image_path, annotation_path):
+        # outputs of an augmentation the sample no longer gets
+        for path in (image_path, annotation_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+    def flush(self):
+        """Waits for queued writes and returns the (owner, error) pairs collected since the last flush."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending == 0)
+            errors, self.errors = self.errors, []
+        return errors
+
+
+    def close(self):
+        errors = self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+        return errors
+
+
+    def _submit(self, function, path, data):
+        owner = self.owner if self.owner is not None else path
+        if self.executor is None:
+            self._run(function, path, data, owner)
+            return
+        self.slots.acquire()
+        with self.condition:
+            self.pending += 1
+        self.executor.submit(self._run_queued, function, path, data, owner)
+
+
+    def _run_queued(self, function, path, data, owner):
+        try:
+            self._run(function, path, data, owner)
+        finally:
+            self.slots.release()
+            with self.condition:
+                self.pending -= 1
+                self.condition.notify_all()
+
+
+    def _run(self, function, path, data, owner):
+        try:
+            function(path, data)
+        except Exception as e:
+            with self.condition:
+                self.errors.append((owner, f"{type(e).__name__}: {e}"))
+
+
+    def _write_image(self, path, image):
+        with metrics.timer('image_encode'):
+            ok, buffer = cv2.imencode(os.path.splitext(str(path))[1], image)
+        if not ok:
+            raise OSError(f"cv2.imencode failed for {path}")
+        with metrics.timer('image_write'):
+            self._replace(path, buffer)
+        metrics.add('images_written')
+        metrics.add('bytes_written', buffer.nbytes)
+
+
+    def _write_annotation(self, path, boxes):
+        with metrics.timer('label_write'):
+            text = format_yolo(boxes)
+            self._replace(path, text.encode())
+        metrics.add('labels_written')
+        metrics.add('bytes_written', len(text))
+
+
+    def _write_file(self, path, source_path):
+        with metrics.timer('file_passthrough'):
+            # an earlier run may have left a link or a copy of the source in place
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            if self.link:
+                try:
+                    os.link(source_path, path)
+                    metrics.add('files_linked')
+                    return
+                except OSError:
+                    # another filesystem or no hardlink support
+                    pass
+            # copyfile lets the kernel copy the bytes (sendfile) without passing them through python
+            shutil.copyfile(source_path, path)
+        metrics.add('files_copied')
+        metrics.add('bytes_written', os.path.getsize(path))
+
+
+    def _replace(self, path, data):
+        # a new file takes the place of the old output: an output hardlinked to the source by an earlier
+        # passthrough run is never written through, whatever the link mode of this run
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,57 @@
+import hashlib
+import cv2
+import numpy as np
+from statistics import NormalDist
+
+# every pixel value, the domain of the lookup tables
+LEVELS = np.arange(256, dtype=np.float32)
+
+# 256 evenly spaced standard normal quantiles, noise is drawn by indexing them with random bytes
+NORMAL_QUANTILES = np.array([NormalDist().inv_cdf((i + 0.5) / 256) for i in range(256)], dtype=np.float32)
+
+
+def sample_rng(name, augmentation, seed=0):
+    # the same sample gets the same draws in serial, parallel and resumed runs
+    key = f"{seed}:{name}:{augmentation}".encode()
+    return np.random.default_rng(int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little'))
+
+
+def _to_lut(values):
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+#lookup tables
+def brightness_lut(rng, limit):
+    return _to_lut(LEVELS + rng.uniform(-limit, limit) * 255)
+
+
+def contrast_lut(rng, limit):
+    return _to_lut((LEVELS - 127.5) * rng.uniform(1 - limit, 1 + limit) + 127.5)
+
+
+def gamma_lut(rng, limit):
+    return _to_lut(255 * (LEVELS / 255) ** rng.uniform(1 - limit, 1 + limit))
+
+
+def hue_saturation_lut(rng, hue_limit, saturation_limit):
+    # one table per HSV channel, OpenCV stores 8-bit hue as 0..179
+    hue = (LEVELS + rng.uniform(-hue_limit, hue_limit)) % 180
+    saturation = LEVELS * rng.uniform(1 - saturation_limit, 1 + saturation_limit)
+    return np.dstack([_to_lut(hue), _to_lut(saturation), _to_lut(LEVELS)])
+
+
+#apply
+def apply_lut(image, lut):
+    return cv2.LUT(image, lut)
+
+
+def apply_hue_saturation(image, lut):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    return cv2.cvtColor(cv2.LUT(hsv, lut), cv2.COLOR_HSV2BGR)
+
+
+def apply_noise(image, rng, std):
+    # gaussian noise without per-pixel float math: random bytes index a table of scaled quantiles
+    offsets = np.rint(NORMAL_QUANTILES * std).astype(np.int16)
+    noise = offsets[rng.integers(0, 256, size=image.shape, dtype=np.uint8)]
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
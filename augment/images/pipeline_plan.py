@@ -0,0 +1,201 @@
+import hashlib
+from dataclasses import dataclass
+from core.config_data import open_config, image_path
+from augment.images.dedup import DEDUP_MODES
+from augment.images.processor_image import (OPERATIONS, GEOMETRIC_OPERATIONS, RANDOM_OPERATIONS, MULTI_IMAGE_OPERATIONS,
+                                             REDUCED_DECODE_FLAGS, get_resize_shape)
+
+OUTPUT_FORMATS = ('folders', 'shards', 'tensor')
+PASSTHROUGH_MODES = ('link', 'copy', 'off')
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    name: str
+    method: str
+    params: tuple = ()
+
+    @property
+    def kwargs(self):
+        return dict(self.params)
+
+
+@dataclass(frozen=True)
+class PipelinePlan:
+    data_path: str
+    classes_path: str
+    preprocessing: tuple
+    augmentations: tuple
+    workers: int = 1
+    chunk_size: int = 16
+    fuse_preprocessing: bool = True
+    reduced_decode: bool = True
+    writer_threads: int = 0
+    writer_queue_size: int = 32
+    cache_dir: str = None
+    cache_size_mb: int = 2048
+    metrics: bool = False
+    metrics_path: str = None
+    prometheus_path: str = None
+    prometheus_interval: float = 30.0
+    output_format: str = 'folders'
+    shard_size_mb: int = 1024
+    batch_size: int = 0
+    image_cache_mb: int = 512
+    passthrough: str = 'link'
+    dedup: str = 'off'
+    dedup_distance: int = 6
+    dataset_index: bool = False
+    class_balance: bool = False
+    class_weights: tuple = None
+
+    @classmethod
+    def from_config(cls, config_data):
+        chunk_size = int(config_data.get("chunk_size", 16))
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        output_format = config_data.get("output_format", 'folders')
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output_format '{output_format}', expected one of {list(OUTPUT_FORMATS)}")
+        passthrough = config_data.get("passthrough", 'link')
+        if passthrough not in PASSTHROUGH_MODES:
+            raise ValueError(f"Unknown passthrough '{passthrough}', expected one of {list(PASSTHROUGH_MODES)}")
+        dedup = config_data.get("dedup", 'off') or 'off'
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup '{dedup}', expected one of {list(DEDUP_MODES)}")
+        dedup_distance = int(config_data.get("dedup_distance", 6))
+        if not 0 <= dedup_distance < 32:
+            raise ValueError(f"dedup_distance must be in [0, 32), got {dedup_distance}")
+        class_weights = config_data.get("class_weights")
+        if class_weights is not None and not isinstance(class_weights, dict):
+            raise ValueError(f"class_weights must map class names or ids to weights, got {class_weights!r}")
+        fuse_preprocessing = bool(config_data.get("fuse_preprocessing", True))
+        preprocessing = compile_steps(config_data.get("preprocessing") or [], config_data)
+        if any(step.name in MULTI_IMAGE_OPERATIONS for step in preprocessing):
+            raise ValueError(f"Operations {list(MULTI_IMAGE_OPERATIONS)} can only be used as augmentations")
+        if fuse_preprocessing:
+            preprocessing = fuse_geometry(preprocessing)
+        plan = cls(data_path=config_data.get("data_path"),
+                   classes_path=config_data.get("classes_txt_path"),
+                   preprocessing=preprocessing,
+                   augmentations=compile_steps(config_data.get("augmentations") or [], config_data),
+                   workers=int(config_data.get("workers", 1) or 0),
+                   chunk_size=chunk_size,
+                   fuse_preprocessing=fuse_preprocessing,
+                   reduced_decode=bool(config_data.get("reduced_decode", True)),
+                   writer_threads=int(config_data.get("writer_threads", 0) or 0),
+                   writer_queue_size=int(config_data.get("writer_queue_size", 32)),
+                   cache_dir=config_data.get("cache_dir"),
+                   cache_size_mb=int(config_data.get("cache_size_mb", 2048)),
+                   metrics=bool(config_data.get("metrics", False)),
+                   metrics_path=config_data.get("metrics_path"),
+                   prometheus_path=config_data.get("prometheus_path"),
+                   prometheus_interval=float(config_data.get("prometheus_interval", 30)),
+                   output_format=output_format,
+                   shard_size_mb=int(config_data.get("shard_size_mb", 1024)),
+                   batch_size=int(config_data.get("batch_size", 0) or 0),
+                   image_cache_mb=int(config_data.get("image_cache_mb", 512)),
+                   passthrough=passthrough,
+                   dedup=dedup,
+                   dedup_distance=dedup_distance,
+                   dataset_index=bool(config_data.get("dataset_index", False)),
+                   class_balance=bool(config_data.get("class_balance", False)),
+                   class_weights=tuple(class_weights.items()) if class_weights is not None else None)
+        if output_format == 'tensor':
+            if plan.output_size is None or any(step.name in GEOMETRIC_OPERATIONS for step in plan.augmentations):
+                raise ValueError("output_format 'tensor' needs same-shaped outputs: preprocessing has to end in "
+                                 "resize_image with save_proportions: False and augmentations can not resize or crop")
+        return plan
+
+    @property
+    def output_size(self):
+        # (width, height) shared by every output, None when it depends on the source image
+        size = None
+        for step in self.preprocessing:
+            for sub_step in step.kwargs['steps'] if step.name == 'fused_geometry' else (step,):
+                params = sub_step.kwargs
+                if sub_step.name == 'resize_image':
+                    size = None if params['save_proportions'] else (params['w_img'], params['h_img'])
+                elif sub_step.name == 'crop_image' and size is not None:
+                    size = (size[0] - params['crop_left'] - params['crop_right'],
+                            size[1] - params['crop_top'] - params['crop_bottom'])
+        return size
+
+    @property
+    def fingerprint(self):
+        # everything that changes the pixels or boxes of the outputs, or where they are written
+        # the augmentations a pair actually gets (dedup, class balance) are keyed per pair by get_pair_config
+        effective = (self.preprocessing, self.augmentations, self.reduced_decode, self.output_format)
+        return hashlib.blake2b(repr(effective).encode(), digest_size=16).hexdigest()
+
+    @property
+    def multi_image(self):
+        return any(step.name in MULTI_IMAGE_OPERATIONS for step in self.augmentations)
+
+    @property
+    def randomized_preprocessing(self):
+        # seeded by image path, so preprocessed images can not be shared by content digest
+        return any(step.name in RANDOM_OPERATIONS for step in self.preprocessing)
+
+    @property
+    def preprocessing_fingerprint(self):
+        # everything that changes the preprocessed base image
+        effective = (self.preprocessing, self.reduced_decode)
+        return hashlib.blake2b(repr(effective).encode(), digest_size=16).hexdigest()
+
+    @property
+    def decode_resize(self):
+        # the resize the plan starts with, None when the decoder can not skip pixels
+        if not self.reduced_decode or not self.preprocessing:
+            return None
+        step = self.preprocessing[0]
+        if step.name == 'fused_geometry':
+            step = step.kwargs['steps'][0]
+        return step if step.name == 'resize_image' else None
+
+    def decode_scale(self, width, height):
+        # the decoder may skip pixels only when the plan starts by shrinking the image
+        step = self.decode_resize
+        if step is None:
+            return 1
+        scale = max(REDUCED_DECODE_FLAGS)
+        # EXIF rotation may swap the decoded sides, the scale has to fit both
+        for source_width, source_height in ((width, height), (height, width)):
+            new_width, new_height = get_resize_shape(source_width, source_height, **step.kwargs)
+            while scale > 1 and (source_width // scale < new_width or source_height // scale < new_height):
+                scale //= 2
+        return scale
+
+
+def compile_steps(names, config_data):
+    steps = []
+    for name in names:
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {sorted(OPERATIONS)}")
+        method, param_names = OPERATIONS[name]
+        missing = [param for param in param_names if param not in config_data]
+        if missing:
+            raise ValueError(f"Operation '{name}' requires config parameters {missing}")
+        params = tuple((param, config_data[param]) for param in param_names)
+        steps.append(PlanStep(name=name, method=method, params=params))
+    return tuple(steps)
+
+
+def fuse_geometry(steps):
+    fused, chain = [], []
+    for step in steps + (None,):
+        if step is not None and step.name in GEOMETRIC_OPERATIONS:
+            chain.append(step)
+            continue
+        if len(chain) > 1:
+            fused.append(PlanStep(name='fused_geometry', method='warp_image', params=(('steps', tuple(chain)),)))
+        else:
+            fused.extend(chain)
+        chain = []
+        if step is not None:
+            fused.append(step)
+    return tuple(fused)
+
+
+def load_image_plan(config_path=image_path):
+    return PipelinePlan.from_config(open_config(config_path))
@@ -0,0 +1,68 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+# finished chunks between two evictions during a run, the cache outgrows size_mb by at most their images
+EVICT_CHUNKS = 8
+
+
+class PreprocessCache:
+    def __init__(self, cache_dir, size_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(size_mb * 1024 * 1024)
+
+
+    def get_key(self, digest, fingerprint):
+        return hashlib.blake2b(f"{digest}:{fingerprint}".encode(), digest_size=16).hexdigest()
+
+
+    def get(self, key):
+        path = self._get_path(key)
+        try:
+            with np.load(path) as data:
+                image, annotation = data['image'], data['annotation']
+        except (OSError, KeyError, ValueError):
+            return None
+        # mtime is the LRU clock
+        os.utime(path)
+        return image, annotation
+
+
+    def put(self, key, image, annotation):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # raw npz, written aside and renamed so readers in other workers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, image=image, annotation=annotation)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+    def evict(self):
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries, total = [], 0
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.npz'):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+                total += stat.st_size
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
@@ -1,100 +1,64 @@
 from pathlib import Path
+from core.metrics import metrics
 from core.utils import get_basename
 from core.utils import get_basename, get_stem, get_suffix, set_new_filename
+from augment.images.yolo_boxes import read_yolo, clip_boxes, crop_boxes, flip_boxes
+from augment.images.output_writer import FolderWriter
 
 class AnnotationProcessor:
-    def __init__(self, annotation_path, save_annotation_path):
+    def __init__(self, annotation_path, save_annotation_path, writer=None, annotation=None):
         self.annotation_path = annotation_path
         self.annotation_basename = get_basename(self.annotation_path)
         self.annotation_stem_name = get_stem(self.annotation_basename)
         self.annotation_suffix_name = get_suffix(self.annotation_basename)
-        self.annotation = self.open_annotation(self.annotation_path)
+        # parsed on first use, a passthrough copy of the label never needs the boxes
+        self._annotation = annotation
         self.save_annotation_path = save_annotation_path
+        self.writer = writer if writer is not None else FolderWriter()
 
 
+    @property
+    def annotation(self):
+        if self._annotation is None:
+            self._annotation = self.open_annotation(self.annotation_path)
+        return self._annotation
+
+
+    @annotation.setter
+    def annotation(self, annotation):
+        self._annotation = annotation
+
+
+    @metrics.timed('annotation_read')
     def open_annotation(self, annotation_path):
-        annotations = []
-        with open(annotation_path, 'r') as f:
-            for line in f:
-                annotation = [float(x) for x in line.strip().split()]
-                annotations.append(annotation)
-        return annotations
+        annotation = read_yolo(annotation_path)
+        metrics.add('boxes_read', len(annotation))
+        return annotation
     
     
     def save_yolo_annotations(self, annotations, name, preprocessing):
         if not preprocessing:
-            new_annotation_path = Path(self.save_annotation_path) / name
-            with open(new_annotation_path, 'w') as f:
-                for annotation in annotations:
-                    f.write(" ".join(map(str, annotation)) + '\n')
+            self.writer.write_annotation(Path(self.save_annotation_path) / name, annotations)
         else:
             self.annotation = annotations
     
-    #REFACTOR THIS 
     #change size
+    @metrics.timed('annotation_resize')
     def change_size_annotation(self, original_width, original_height, new_width, new_height, preprocess, **kwargs):
-        new_annotations = []
-        scale_x = new_width / original_width
-        scale_y = new_height / original_height
-        for ann in self.annotation:
-            if ann:
-                class_id, x_center, y_center, width, height = ann
-                x_center_abs, y_center_abs, width_abs, height_abs = self._get_absolute_coordinates(x_center = x_center,
-                                                                                                y_center=y_center,
-                                                                                                width=width,
-                                                                                                height=height,
-                                                                                                original_height=original_height,
-                                                                                                original_width=original_width)
-                x_center_new = x_center_abs * scale_x / new_width
-                y_center_new = y_center_abs * scale_y / new_height
-                width_new = width_abs * scale_x / new_width
-                height_new = height_abs * scale_y / new_height
-
-                x_center_new = self._get_limitations(x_center_new)
-                y_center_new = self._get_limitations(y_center_new)
-                width_new = self._get_limitations(width_new)
-                height_new = self._get_limitations(height_new)
-
-                new_ann = [class_id, x_center_new, y_center_new, width_new, height_new]
-                new_annotations.append(new_ann)
-
-        self.save_yolo_annotations(annotations=new_annotations,
+        # normalized boxes do not depend on the image size
+        self.save_yolo_annotations(annotations=clip_boxes(self.annotation),
                                     name=self.annotation_basename,
                                     preprocessing=preprocess)
         
         
     #crop    
+    @metrics.timed('annotation_crop')
     def crop_annotations(self, crop_left, crop_right, crop_top, crop_bottom, original_width, original_height, preprocess):
-        new_annotations = []
-        new_width = original_width - crop_left - crop_right
-        new_height = original_height - crop_top - crop_bottom
-        for ann in self.annotation:
-            if ann:
-                class_id, x_center, y_center, width, height = ann
-                x_center_abs, y_center_abs, width_abs, height_abs = self._get_absolute_coordinates(x_center=x_center,
-                                                                                                y_center=y_center,
-                                                                                                width=width,
-                                                                                                height=height,
-                                                                                                original_height=original_height,
-                                                                                                original_width=original_width)
-                x_center_abs -= crop_left
-                y_center_abs -= crop_top
-                if x_center_abs < 0 or y_center_abs < 0 or x_center_abs > new_width or y_center_abs > new_height:
-                    continue
-
-                x_center_new = x_center_abs / new_width
-                y_center_new = y_center_abs / new_height
-                width_new = width_abs / new_width
-                height_new = height_abs / new_height
-                
-                x_center_new = self._get_limitations(x_center_new)
-                y_center_new = self._get_limitations(y_center_new)
-                width_new = self._get_limitations(width_new)
-                height_new = self._get_limitations(height_new)
-
-                new_ann = [class_id, x_center_new, y_center_new, width_new, height_new]
-                new_annotations.append(new_ann)
-
+        new_annotations = crop_boxes(self.annotation,
+                                     crop_left=crop_left, crop_top=crop_top,
+                                     crop_right=crop_right, crop_bottom=crop_bottom,
+                                     original_width=original_width, original_height=original_height)
+        metrics.add('boxes_dropped_by_crop', len(self.annotation) - len(new_annotations))
         self.save_yolo_annotations(annotations=new_annotations,
                                     name=self.annotation_basename,
                                     preprocessing=preprocess)
@@ -106,78 +70,38 @@ class AnnotationProcessor:
                                     preprocessing=preprocess)
 
         
-    #flip horizontal 
-    def flip_horizontal_annotation(self, preprocess):
-        new_annotations = []
-        for ann in self.annotation:
-            if ann:
-                class_id, x_center, y_center, width, height = ann
-                x_center = 1.0 - x_center
-                x_center = self._get_limitations(x_center)
-                y_center = self._get_limitations(y_center)
+    #unchanged label, the source file is linked or copied
+    def passthrough_annotation(self):
+        self.writer.write_file(Path(self.save_annotation_path) / self.annotation_basename, self.annotation_path)
 
-                new_ann = [class_id, x_center, y_center, width, height]
-                new_annotations.append(new_ann)
-
-        new_name = set_new_filename(stem=self.annotation_stem_name, 
-                                    augmentation='flip_horizontal', suffix=self.annotation_suffix_name)
         
-        self.save_yolo_annotations(annotations=new_annotations,
-                                    name=new_name,
-                                    preprocessing=preprocess)
+    #flip horizontal 
+    def flip_horizontal_annotation(self, preprocess):
+        self._save_flipped(augmentation='flip_horizontal', horizontal=True, vertical=False, preprocess=preprocess)
         
     #flip vertical
     def flip_vertical_annotation(self, preprocess):
-        new_annotations = []
-        for ann in self.annotation:
-            if ann:
-                class_id, x_center, y_center, width, height = ann
-                y_center = 1.0 - y_center
-                x_center = self._get_limitations(x_center)
-                y_center = self._get_limitations(y_center)
-
-                new_ann = [class_id, x_center, y_center, width, height]
-                new_annotations.append(new_ann)
-
-        new_name = set_new_filename(stem=self.annotation_stem_name, 
-                                    augmentation='flip_vertical', suffix=self.annotation_suffix_name)
-        
-        self.save_yolo_annotations(annotations=new_annotations,
-                                    name=new_name,
-                                    preprocessing=preprocess)
+        self._save_flipped(augmentation='flip_vertical', horizontal=False, vertical=True, preprocess=preprocess)
     
-     #flip vertical
+    #flip both
     def flip_both_annotation(self, preprocess):
-        new_annotations = []
-        for ann in self.annotation:
-            if ann:
-                class_id, x_center, y_center, width, height = ann
-                x_center = 1.0 - x_center
-                y_center = 1.0 - y_center
-                x_center = self._get_limitations(x_center)
-                y_center = self._get_limitations(y_center)
-
-                new_ann = [class_id, x_center, y_center, width, height]
-                new_annotations.append(new_ann)
+        self._save_flipped(augmentation='flip_both', horizontal=True, vertical=True, preprocess=preprocess)
 
-        new_name = set_new_filename(stem=self.annotation_stem_name, 
-                                    augmentation='flip_both', suffix=self.annotation_suffix_name)
-        
-        self.save_yolo_annotations(annotations=new_annotations,
+    #photometric augmentations keep the boxes
+    def photometric_annotation(self, augmentation, preprocess):
+        new_name = set_new_filename(stem=self.annotation_stem_name,
+                                    augmentation=augmentation, suffix=self.annotation_suffix_name)
+        self.save_yolo_annotations(annotations=self.annotation,
                                     name=new_name,
                                     preprocessing=preprocess)
         
-        
 
     # annotation extra function
-    def _get_absolute_coordinates(self, x_center, y_center, width, height, original_width, original_height):
-        x_center_abs = x_center * original_width
-        y_center_abs = y_center * original_height
-        width_abs = width * original_width
-        height_abs = height * original_height
-        return x_center_abs, y_center_abs, width_abs, height_abs
-    
-
-    def _get_limitations(self, value):
-        return min(max(value, 0), 1)
-    
+    @metrics.timed('annotation_flip')
+    def _save_flipped(self, augmentation, horizontal, vertical, preprocess):
+        new_annotations = flip_boxes(self.annotation, horizontal=horizontal, vertical=vertical)
+        new_name = set_new_filename(stem=self.annotation_stem_name, 
+                                    augmentation=augmentation, suffix=self.annotation_suffix_name)
+        self.save_yolo_annotations(annotations=new_annotations,
+                                    name=new_name,
+                                    preprocessing=preprocess)
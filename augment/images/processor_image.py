@@ -1,39 +1,160 @@
 import cv2
+from core.metrics import metrics
 from core.utils import get_basename, get_stem, get_suffix, set_new_filename
 from augment.images.processor_annotation import AnnotationProcessor
+from augment.images.output_writer import FolderWriter
+from augment.images.multi_image import mosaic, mixup
+from augment.images.photometric import (sample_rng, brightness_lut, contrast_lut, gamma_lut, hue_saturation_lut,
+                                        apply_lut, apply_hue_saturation, apply_noise)
+
+# operation name -> (ImageProcessor method, config parameters bound to it)
+OPERATIONS = {
+    'basic': ('preprocessing_save_image', ()),
+    'resize_image': ('change_size_image', ('w_img', 'h_img', 'save_proportions')),
+    'crop_image': ('crop_image', ('crop_left', 'crop_right', 'crop_top', 'crop_bottom')),
+    'flip_horizontal': ('flip_horizontal_image', ()),
+    'flip_vertical': ('flip_vertical_image', ()),
+    'flip_both': ('flip_both_image', ()),
+    'brightness': ('brightness_image', ('brightness_limit', 'augmentation_seed')),
+    'contrast': ('contrast_image', ('contrast_limit', 'augmentation_seed')),
+    'gamma': ('gamma_image', ('gamma_limit', 'augmentation_seed')),
+    'hue_saturation': ('hue_saturation_image', ('hue_shift_limit', 'saturation_limit', 'augmentation_seed')),
+    'noise': ('noise_image', ('noise_std', 'augmentation_seed')),
+    'mosaic': ('mosaic_image', ('augmentation_seed', 'partner_window')),
+    'mixup': ('mixup_image', ('mixup_alpha', 'augmentation_seed', 'partner_window')),
+}
+
+# operations whose result depends on a per-sample seed derived from the image path
+RANDOM_OPERATIONS = ('brightness', 'contrast', 'gamma', 'hue_saturation', 'noise', 'mosaic', 'mixup')
+
+# operations that combine the image with partner images of the same split -> number of partners they take
+MULTI_IMAGE_OPERATIONS = {'mosaic': 3, 'mixup': 1}
+
+# cv2.imread flags that let the JPEG decoder skip pixels, by downscale factor
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# consecutive geometric preprocessing steps are fused into a single warp_image call
+GEOMETRIC_OPERATIONS = ('resize_image', 'crop_image')
+
+
+def get_resize_shape(original_width, original_height, w_img, h_img, save_proportions, **kwargs):
+    if save_proportions:
+        aspect_ratio = original_width / original_height
+        if w_img / h_img > aspect_ratio:
+            new_height = h_img
+            new_width = int(h_img * aspect_ratio)
+        else:
+            new_width = w_img
+            new_height = int(w_img / aspect_ratio)
+    else:
+        new_width = w_img
+        new_height = h_img
+    return new_width, new_height
+
+
+def compose_geometry(steps, width, height):
+    # the current image is kept as an affine map of the source: x = x_src * scale + shift
+    scale_x, scale_y, shift_x, shift_y = 1.0, 1.0, 0.0, 0.0
+    for step in steps:
+        params = step.kwargs
+        if step.name == 'resize_image':
+            new_width, new_height = get_resize_shape(width, height, **params)
+            step_x, step_y = new_width / width, new_height / height
+            scale_x, shift_x = scale_x * step_x, shift_x * step_x
+            scale_y, shift_y = scale_y * step_y, shift_y * step_y
+            width, height = new_width, new_height
+        elif step.name == 'crop_image':
+            shift_x -= params['crop_left']
+            shift_y -= params['crop_top']
+            width -= params['crop_left'] + params['crop_right']
+            height -= params['crop_top'] + params['crop_bottom']
+        else:
+            raise ValueError(f"Operation '{step.name}' can not be fused")
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Operation '{step.name}' produces an empty image")
+    source_rect = (-shift_x / scale_x, -shift_y / scale_y,
+                   (width - shift_x) / scale_x, (height - shift_y) / scale_y)
+    return source_rect, (width, height)
+
 
 class ImageProcessor:
-    def __init__(self, image_path, annotation_path, save_image_path, save_annotation_path):
+    def __init__(self, image_path, annotation_path, save_image_path, save_annotation_path,
+                 decode_scale=1, source_size=None, writer=None, image=None, annotation=None, partners=None,
+                 passthrough=False, sample_key=None):
         self.image_path = image_path
         self.image_basename = get_basename(self.image_path)
         self.image_stem_name = get_stem(self.image_basename)
+        # seeds the random draws, the path inside the dataset tells apart same-named images of the splits
+        self.sample_key = sample_key if sample_key is not None else self.image_stem_name
         self.image_suffix_name = get_suffix(self.image_basename)
-        self.image = self.open_image(self.image_path)
+        # decoded by load() or on first use, outputs that copy the source file never need the pixels
+        self._image = image
+        self.decode_scale = decode_scale
+        self.source_size = source_size
+        self._image_size = None
+        # the source files are the basic output as they are, so they can be linked or copied
+        self.passthrough = passthrough
         self.save_image_path = save_image_path
+        self.writer = writer if writer is not None else FolderWriter()
+        # source of preprocessed partner images for mosaic and mixup
+        self.partners = partners
 
         self.ap = AnnotationProcessor(annotation_path=annotation_path,
-                                 save_annotation_path=save_annotation_path)
+                                 save_annotation_path=save_annotation_path,
+                                 writer=self.writer,
+                                 annotation=annotation)
+
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = self.open_image(self.image_path, self.decode_scale)
+        return self._image
+
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+
+
+    @property
+    def image_size(self):
+        # full resolution size the geometry is planned on, the decoded image may be smaller
+        if self._image_size is None:
+            self._image_size = self._get_image_size(self.source_size)
+        return self._image_size
+
+
+    @image_size.setter
+    def image_size(self, image_size):
+        self._image_size = image_size
+
+
+    def load(self):
+        # decodes the image and parses the labels now instead of inside the first operation
+        return self.image, self.ap.annotation
     
     #open
-    def open_image(self, image_path):
-        return cv2.imread(image_path)
+    @metrics.timed('image_decode')
+    def open_image(self, image_path, decode_scale=1):
+        if decode_scale > 1:
+            image = cv2.imread(image_path, REDUCED_DECODE_FLAGS[decode_scale])
+        else:
+            image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Cannot read image {image_path}")
+        return image
     
     #resize 
+    @metrics.timed('image_resize')
     def change_size_image(self, w_img, h_img, save_proportions, preprocess, **kwargs):
         img = self.image
-        original_height, original_width = img.shape[:2]
-
-        if save_proportions:
-            aspect_ratio = original_width / original_height
-            if w_img / h_img > aspect_ratio:
-                new_height = h_img
-                new_width = int(h_img * aspect_ratio)
-            else:
-                new_width = w_img
-                new_height = int(w_img / aspect_ratio)
-        else:
-            new_width = w_img
-            new_height = h_img
+        original_width, original_height = self.image_size
+        new_width, new_height = get_resize_shape(original_width, original_height, w_img, h_img, save_proportions)
 
         resized_img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
 
@@ -47,6 +168,7 @@ class ImageProcessor:
 
     
     #crop
+    @metrics.timed('image_crop')
     def crop_image(self, crop_left, crop_right, crop_top, crop_bottom, preprocess, **kwargs):
         img = self.image
         original_height, original_width = img.shape[:2]
@@ -61,8 +183,43 @@ class ImageProcessor:
                                original_width=original_width, original_height=original_height,
                                preprocess=preprocess)
         
+    #fused resize/crop chain: one resample of the source region, one annotation pass
+    @metrics.timed('image_warp')
+    def warp_image(self, steps, preprocess, **kwargs):
+        img = self.image
+        original_height, original_width = img.shape[:2]
+        source_rect, (new_width, new_height) = compose_geometry(steps, *self.image_size)
+        # map the region from the planned size to the decoded pixels
+        scale_x = original_width / self.image_size[0]
+        scale_y = original_height / self.image_size[1]
+        left, right = int(round(source_rect[0] * scale_x)), int(round(source_rect[2] * scale_x))
+        top, bottom = int(round(source_rect[1] * scale_y)), int(round(source_rect[3] * scale_y))
+        left, right = min(max(left, 0), original_width), min(max(right, 0), original_width)
+        top, bottom = min(max(top, 0), original_height), min(max(bottom, 0), original_height)
+        if right <= left or bottom <= top:
+            raise ValueError(f"Preprocessing leaves an empty region of {self.image_basename}")
+
+        region = img[top:bottom, left:right]
+        if region.shape[:2] == (new_height, new_width):
+            warped_img = region
+        else:
+            warped_img = cv2.resize(region, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+        # resizing keeps normalized boxes, so the whole chain is a crop of the source region
+        self.ap.crop_annotations(crop_left=left, crop_right=original_width - right,
+                                 crop_top=top, crop_bottom=original_height - bottom,
+                                 original_width=original_width, original_height=original_height,
+                                 preprocess=preprocess)
+        self._save_image(name=self.image_basename, img=warped_img, preprocessing=preprocess)
+
+
     #save basic image after preprocessing
+    @metrics.timed('image_basic')
     def preprocessing_save_image(self, preprocess, **kwargs):
+        if self.passthrough and not preprocess:
+            self.writer.write_file(self.save_image_path / self.image_basename, self.image_path)
+            self.ap.passthrough_annotation()
+            return
         self.ap.preprocessing_save_annotation(preprocess=preprocess)
         self._save_image(name=self.image_basename, img=self.image, preprocessing=preprocess)
 
@@ -73,6 +230,7 @@ class ImageProcessor:
     
     
     #flip horizontal
+    @metrics.timed('image_flip_horizontal')
     def flip_horizontal_image(self, preprocess, **kwargs):
         image = self.flip_image(image=self.image, flip_code=1)
         new_name = set_new_filename(stem=self.image_stem_name, 
@@ -82,6 +240,7 @@ class ImageProcessor:
 
 
     #flip vertical
+    @metrics.timed('image_flip_vertical')
     def flip_vertical_image(self, preprocess, **kwargs):
         image = self.flip_image(image=self.image, flip_code=0)
         new_name = set_new_filename(stem=self.image_stem_name, 
@@ -91,6 +250,7 @@ class ImageProcessor:
 
 
     #flip-both
+    @metrics.timed('image_flip_both')
     def flip_both_image(self, preprocess, **kwargs):
         image = self.flip_image(image=self.image, flip_code=-1)
         # image = self.flip_image(image=image, flip_code=1)
@@ -100,10 +260,113 @@ class ImageProcessor:
         self.ap.flip_both_annotation(preprocess=preprocess)
 
 
+    #photometric
+    @metrics.timed('image_brightness')
+    def brightness_image(self, brightness_limit, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'brightness', augmentation_seed)
+        self._save_photometric('brightness', apply_lut(self.image, brightness_lut(rng, brightness_limit)), preprocess)
+
+
+    @metrics.timed('image_contrast')
+    def contrast_image(self, contrast_limit, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'contrast', augmentation_seed)
+        self._save_photometric('contrast', apply_lut(self.image, contrast_lut(rng, contrast_limit)), preprocess)
+
+
+    @metrics.timed('image_gamma')
+    def gamma_image(self, gamma_limit, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'gamma', augmentation_seed)
+        self._save_photometric('gamma', apply_lut(self.image, gamma_lut(rng, gamma_limit)), preprocess)
+
+
+    @metrics.timed('image_hue_saturation')
+    def hue_saturation_image(self, hue_shift_limit, saturation_limit, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'hue_saturation', augmentation_seed)
+        lut = hue_saturation_lut(rng, hue_shift_limit, saturation_limit)
+        self._save_photometric('hue_saturation', apply_hue_saturation(self.image, lut), preprocess)
+
+
+    @metrics.timed('image_noise')
+    def noise_image(self, noise_std, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'noise', augmentation_seed)
+        self._save_photometric('noise', apply_noise(self.image, rng, noise_std), preprocess)
+
+
+    #multi-image
+    @metrics.timed('image_mosaic')
+    def mosaic_image(self, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'mosaic', augmentation_seed)
+        samples = [(self.image, self.ap.annotation)] + self._get_partners('mosaic')
+        samples = [samples[index] for index in rng.permutation(len(samples))]
+        image, annotation = mosaic(samples, width=self.image.shape[1], height=self.image.shape[0], rng=rng)
+        self.save_augmentation('mosaic', image, annotation)
+
+
+    @metrics.timed('image_mixup')
+    def mixup_image(self, mixup_alpha, augmentation_seed, preprocess, **kwargs):
+        rng = sample_rng(self.sample_key, 'mixup', augmentation_seed)
+        (partner_image, partner_annotation), = self._get_partners('mixup')
+        image, annotation = mixup(self.image, self.ap.annotation, partner_image, partner_annotation,
+                                  rng=rng, alpha=mixup_alpha)
+        self.save_augmentation('mixup', image, annotation)
+
+
+    def _get_partners(self, operation):
+        if self.partners is None:
+            raise ValueError("mosaic and mixup need partner images, none were given to the processor")
+        return self.partners.sample(self.image_path, operation)
+
+
+    def _save_photometric(self, augmentation, image, preprocess):
+        # pixel values change, boxes stay where they are
+        new_name = set_new_filename(stem=self.image_stem_name,
+                                    augmentation=augmentation, suffix=self.image_suffix_name)
+        self._save_image(name=new_name, img=image, preprocessing=preprocess)
+        self.ap.photometric_annotation(augmentation=augmentation, preprocess=preprocess)
+
+
+    #save a result computed outside of the per-image ops (batched kernels)
+    def save_augmentation(self, augmentation, image, annotation):
+        image_name, annotation_name = self._get_output_names(augmentation)
+        self._save_image(name=image_name, img=image, preprocessing=False)
+        self.ap.save_yolo_annotations(annotations=annotation, name=annotation_name, preprocessing=False)
+
+
+    def remove_augmentations(self, augmentations):
+        # writers that can not remove what they wrote (append-only shards) keep the old outputs
+        if not augmentations or not hasattr(self.writer, 'remove_output'):
+            return
+        for augmentation in augmentations:
+            image_name, annotation_name = self._get_output_names(augmentation)
+            self.writer.remove_output(self.save_image_path / image_name,
+                                      self.ap.save_annotation_path / annotation_name)
+
+
+    def _get_output_names(self, augmentation):
+        if augmentation == 'basic':
+            return self.image_basename, self.ap.annotation_basename
+        image_name = set_new_filename(stem=self.image_stem_name,
+                                      augmentation=augmentation, suffix=self.image_suffix_name)
+        annotation_name = set_new_filename(stem=self.ap.annotation_stem_name,
+                                           augmentation=augmentation, suffix=self.ap.annotation_suffix_name)
+        return image_name, annotation_name
+
 
     #save
     def _save_image(self, name, img, preprocessing):
         if not preprocessing:
-            cv2.imwrite(self.save_image_path / name, img)
+            self.writer.write_image(self.save_image_path / name, img)
         else:
-            self.image = img
\ No newline at end of file
+            self.image = img
+            self.image_size = (img.shape[1], img.shape[0])
+
+
+    def _get_image_size(self, source_size):
+        height, width = self.image.shape[:2]
+        if source_size is None:
+            return width, height
+        # cv2.imread applies EXIF rotation, so the header sides may come swapped
+        source_width, source_height = source_size
+        if (width >= height) != (source_width >= source_height):
+            source_width, source_height = source_height, source_width
+        return source_width, source_height
\ No newline at end of file
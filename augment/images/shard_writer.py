@@ -0,0 +1,152 @@
+import os
+import glob
+import json
+import time
+import tarfile
+import cv2
+from core.metrics import metrics
+from augment.images.yolo_boxes import format_yolo
+
+SHARDS_FOLDER = 'shards'
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+class ShardWriter:
+    def __init__(self, root, max_bytes, prefix):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.shards_path = os.path.join(root, SHARDS_FOLDER)
+        os.makedirs(self.shards_path, exist_ok=True)
+        self.index_path = os.path.join(self.shards_path, f"{prefix}.index.jsonl")
+        self.shard_number = 0
+        self.shard_name = None
+        self.file = None
+        self.index = []
+        self.errors = []
+        self.owner = None
+
+
+    def begin_sample(self, key, slot=None):
+        self.owner = key
+
+
+    def write_image(self, path, image):
+        with metrics.timer('image_encode'):
+            ok, buffer = cv2.imencode(os.path.splitext(str(path))[1], image)
+        if not ok:
+            self.errors.append((self._get_owner(path), f"OSError: cv2.imencode failed for {path}"))
+            return
+        self._add(path, buffer.tobytes())
+        metrics.add('images_written')
+
+
+    def write_annotation(self, path, boxes):
+        self._add(path, format_yolo(boxes).encode())
+        metrics.add('labels_written')
+
+
+    def write_file(self, path, source_path):
+        try:
+            with open(source_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            self.errors.append((self._get_owner(path), f"{type(e).__name__}: {e}"))
+            return
+        self._add(path, data)
+        metrics.add('files_copied')
+
+
+    def flush(self):
+        # members written so far are readable once flushed, the archive is sealed at the end of the run
+        if self.file is not None:
+            self.file.flush()
+        if self.index:
+            with open(self.index_path, 'a') as f:
+                f.writelines(json.dumps(record) + '\n' for record in self.index)
+            self.index = []
+        errors, self.errors = self.errors, []
+        return errors
+
+
+    def close(self):
+        errors = self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return errors
+
+
+    def _add(self, path, data):
+        name = os.path.relpath(str(path), self.root).replace(os.sep, '/')
+        try:
+            with metrics.timer('shard_write'):
+                if self.file is None or (self.file.tell() > 0 and self.file.tell() + len(data) > self.max_bytes):
+                    self._next_shard()
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                header = info.tobuf(format=tarfile.PAX_FORMAT)
+                offset = self.file.tell() + len(header)
+                self.file.write(header)
+                self.file.write(data)
+                self.file.write(b'\0' * (-len(data) % BLOCK_SIZE))
+            self.index.append({'name': name, 'shard': self.shard_name, 'offset': offset, 'size': len(data)})
+            metrics.add('bytes_written', len(data))
+        except Exception as e:
+            self.errors.append((self._get_owner(path), f"{type(e).__name__}: {e}"))
+
+
+    def _next_shard(self):
+        if self.file is not None:
+            self.file.close()
+        while True:
+            self.shard_number += 1
+            self.shard_name = f"{self.prefix}-{self.shard_number:06d}.tar"
+            try:
+                self.file = open(os.path.join(self.shards_path, self.shard_name), 'xb')
+                return
+            except FileExistsError:
+                # shards of an earlier run with the same prefix are kept
+                continue
+
+
+    def _get_owner(self, path):
+        return self.owner if self.owner is not None else path
+
+
+def seal_shards(root):
+    # appending the end-of-archive blocks is all tarfile.close() would add; extra ones are harmless
+    for shard_path in glob.glob(os.path.join(root, SHARDS_FOLDER, '*.tar')):
+        with open(shard_path, 'ab') as f:
+            f.write(b'\0' * BLOCK_SIZE * 2)
+
+
+class ShardIndex:
+    def __init__(self, root):
+        self.shards_path = os.path.join(root, SHARDS_FOLDER)
+        self.records = {}
+        for index_path in sorted(glob.glob(os.path.join(self.shards_path, '*.index.jsonl'))):
+            with open(index_path, 'r') as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.records[record['name']] = record
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    def __contains__(self, name):
+        return name in self.records
+
+
+    def names(self):
+        return self.records.keys()
+
+
+    def read(self, name):
+        record = self.records[name]
+        with open(os.path.join(self.shards_path, record['shard']), 'rb') as f:
+            f.seek(record['offset'])
+            return f.read(record['size'])
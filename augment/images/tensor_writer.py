@@ -0,0 +1,219 @@
+import os
+import glob
+import json
+import numpy as np
+from core.metrics import metrics
+from augment.images.yolo_boxes import BOX_COLUMNS, empty_boxes
+
+TENSOR_FOLDER = 'tensor'
+PARTS_FOLDER = 'parts'
+
+
+#worker side: pixels go straight to their row of images.u8, boxes to a per-worker part file
+class TensorWriter:
+    def __init__(self, root, height, width, prefix):
+        self.root = root
+        self.frame_shape = (height, width, 3)
+        self.frame_bytes = height * width * 3
+        tensor_path = os.path.join(root, TENSOR_FOLDER)
+        parts_path = os.path.join(tensor_path, PARTS_FOLDER)
+        os.makedirs(parts_path, exist_ok=True)
+        self.images_fd = os.open(os.path.join(tensor_path, 'images.u8'), os.O_WRONLY | os.O_CREAT)
+        self.boxes_path = os.path.join(parts_path, f"{prefix}.boxes.f32")
+        self.index_path = os.path.join(parts_path, f"{prefix}.index.jsonl")
+        self.boxes_rows = os.path.getsize(self.boxes_path) // (BOX_COLUMNS * 4) if os.path.exists(self.boxes_path) else 0
+        self.records = {}
+        # names of rows an incremental run no longer produces
+        self.removed = []
+        self.errors = []
+        self.owner = None
+        self.slot = None
+        self.image_count = 0
+        self.label_count = 0
+
+
+    def begin_sample(self, key, slot=None):
+        self.owner = key
+        self.slot = slot
+        self.image_count = 0
+        self.label_count = 0
+
+
+    def write_image(self, path, image):
+        slot = self.slot + self.image_count
+        self.image_count += 1
+        if image.shape != self.frame_shape:
+            self.errors.append((self.owner, f"ValueError: {path} has shape {image.shape}, tensor rows are {self.frame_shape}"))
+            return
+        with metrics.timer('tensor_write'):
+            os.pwrite(self.images_fd, np.ascontiguousarray(image).data, slot * self.frame_bytes)
+        self._get_record(slot)['name'] = os.path.relpath(str(path), self.root).replace(os.sep, '/')
+        metrics.add('images_written')
+        metrics.add('bytes_written', self.frame_bytes)
+
+
+    def write_annotation(self, path, boxes):
+        slot = self.slot + self.label_count
+        self.label_count += 1
+        with open(self.boxes_path, 'ab') as f:
+            f.write(np.ascontiguousarray(boxes, dtype=np.float32).tobytes())
+        record = self._get_record(slot)
+        record['start'], record['count'] = self.boxes_rows, len(boxes)
+        self.boxes_rows += len(boxes)
+        metrics.add('labels_written')
+
+
+    def remove_output(self, image_path, annotation_path):
+        self.removed.append(os.path.relpath(str(image_path), self.root).replace(os.sep, '/'))
+
+
+    def flush(self):
+        if self.records or self.removed:
+            with open(self.index_path, 'a') as f:
+                f.writelines(json.dumps(record) + '\n' for record in self.records.values()
+                             if 'name' in record and 'start' in record)
+                f.writelines(json.dumps({'removed': name}) + '\n' for name in self.removed)
+            self.records = {}
+            self.removed = []
+        errors, self.errors = self.errors, []
+        return errors
+
+
+    def close(self):
+        errors = self.flush()
+        os.close(self.images_fd)
+        return errors
+
+
+    def _get_record(self, slot):
+        return self.records.setdefault(slot, {'slot': slot})
+
+
+#main side: allocates rows and merges the worker parts into the final arrays
+class TensorStore:
+    def __init__(self, root, height, width):
+        self.tensor_path = os.path.join(root, TENSOR_FOLDER)
+        os.makedirs(self.tensor_path, exist_ok=True)
+        self.frame_bytes = height * width * 3
+        self.height, self.width = height, width
+        self.meta_path = os.path.join(self.tensor_path, 'meta.json')
+        self.images_path = os.path.join(self.tensor_path, 'images.u8')
+        self.base = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            if (meta['height'], meta['width']) != (height, width):
+                raise ValueError(f"Existing tensor rows are {meta['height']}x{meta['width']}, plan produces {height}x{width}")
+            self.base = meta['count']
+        # parts still here were never merged: a killed run wrote them, their rows are at or beyond base
+        for part_path in glob.glob(os.path.join(self.tensor_path, PARTS_FOLDER, '*')):
+            os.remove(part_path)
+        self.next_slot = self.base
+        self.capacity = self.base
+
+
+    def reserve(self, count):
+        slot = self.next_slot
+        self.next_slot += count
+        if self.next_slot > self.capacity:
+            # rows are pre-allocated in growing steps instead of one file extension per sample
+            self.capacity = max(self.next_slot, self.capacity * 2, 1024)
+            with open(self.images_path, 'ab') as f:
+                f.truncate(self.capacity * self.frame_bytes)
+        return slot
+
+
+    def finalize(self):
+        count = self.next_slot
+        names, offsets, boxes, valid = self._load_existing(count)
+        parts = sorted(glob.glob(os.path.join(self.tensor_path, PARTS_FOLDER, '*.index.jsonl')))
+        new_boxes, removed = {}, set()
+        for index_path in parts:
+            part_boxes = np.fromfile(index_path.replace('.index.jsonl', '.boxes.f32'), dtype=np.float32)
+            part_boxes = part_boxes.reshape(-1, BOX_COLUMNS)
+            with open(index_path, 'r') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if 'removed' in record:
+                        removed.add(record['removed'])
+                        continue
+                    names[record['slot']] = record['name']
+                    valid[record['slot']] = True
+                    new_boxes[record['slot']] = part_boxes[record['start']:record['start'] + record['count']]
+
+        # a sample re-processed by an incremental run supersedes its older row
+        latest = {}
+        for slot, name in enumerate(names):
+            if name in removed:
+                valid[slot] = False
+            if valid[slot]:
+                if name in latest:
+                    valid[latest[name]] = False
+                latest[name] = slot
+
+        counts = np.zeros(count, dtype=np.int64)
+        chunks = []
+        for slot in range(count):
+            sample = new_boxes.get(slot)
+            if sample is None and slot < self.base:
+                sample = boxes[offsets[slot]:offsets[slot + 1]]
+            if sample is None:
+                sample = empty_boxes()
+            counts[slot] = len(sample)
+            chunks.append(sample)
+        new_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_offsets[1:])
+
+        with open(self.images_path, 'ab') as f:
+            f.truncate(count * self.frame_bytes)
+        np.save(os.path.join(self.tensor_path, 'boxes.npy'), np.concatenate(chunks) if chunks else empty_boxes())
+        np.save(os.path.join(self.tensor_path, 'offsets.npy'), new_offsets)
+        np.save(os.path.join(self.tensor_path, 'valid.npy'), valid)
+        with open(os.path.join(self.tensor_path, 'names.json'), 'w') as f:
+            json.dump(names, f)
+        # meta.json is written last, it is what marks the rows as committed
+        with open(self.meta_path + '.tmp', 'w') as f:
+            json.dump({'count': count, 'height': self.height, 'width': self.width, 'channels': 3}, f)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+        for index_path in parts:
+            os.remove(index_path)
+            os.remove(index_path.replace('.index.jsonl', '.boxes.f32'))
+        for part_path in glob.glob(os.path.join(self.tensor_path, PARTS_FOLDER, '*')):
+            # boxes of writers that never flushed an index
+            os.remove(part_path)
+        self.base = self.capacity = count
+
+
+    def _load_existing(self, count):
+        names, valid = [''] * count, np.zeros(count, dtype=bool)
+        offsets, boxes = np.zeros(1, dtype=np.int64), empty_boxes()
+        if self.base:
+            with open(os.path.join(self.tensor_path, 'names.json'), 'r') as f:
+                names[:self.base] = json.load(f)
+            valid[:self.base] = np.load(os.path.join(self.tensor_path, 'valid.npy'))
+            offsets = np.load(os.path.join(self.tensor_path, 'offsets.npy'))
+            boxes = np.load(os.path.join(self.tensor_path, 'boxes.npy'))
+        return names, offsets, boxes, valid
+
+
+def load_tensor_dataset(root):
+    """
+    Opens an exported tensor dataset without reading the pixels.
+    Returns images as a read-only (N, H, W, 3) uint8 memmap, boxes (M, 5) with per-sample offsets (N + 1),
+    the valid mask and sample names; boxes of sample i are boxes[offsets[i]:offsets[i + 1]].
+    """
+    tensor_path = os.path.join(root, TENSOR_FOLDER)
+    with open(os.path.join(tensor_path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    shape = (meta['count'], meta['height'], meta['width'], meta['channels'])
+    if meta['count']:
+        images = np.memmap(os.path.join(tensor_path, 'images.u8'), dtype=np.uint8, mode='r', shape=shape)
+    else:
+        images = np.zeros(shape, dtype=np.uint8)
+    with open(os.path.join(tensor_path, 'names.json'), 'r') as f:
+        names = json.load(f)
+    return {'images': images,
+            'boxes': np.load(os.path.join(tensor_path, 'boxes.npy'), mmap_mode='r'),
+            'offsets': np.load(os.path.join(tensor_path, 'offsets.npy')),
+            'valid': np.load(os.path.join(tensor_path, 'valid.npy')),
+            'names': names}
@@ -0,0 +1,64 @@
+import numpy as np
+
+# YOLO boxes are kept as an (N, 5) float32 array: class_id, x_center, y_center, width, height
+BOX_COLUMNS = 5
+LINE_FORMAT = '%d %.6f %.6f %.6f %.6f\n'
+
+
+def empty_boxes():
+    return np.zeros((0, BOX_COLUMNS), dtype=np.float32)
+
+
+#read / write
+def parse_yolo(text):
+    values = np.array(text.split(), dtype=np.float32)
+    if values.size % BOX_COLUMNS:
+        raise ValueError(f"YOLO annotation must have {BOX_COLUMNS} values per box, got {values.size} values")
+    return values.reshape(-1, BOX_COLUMNS)
+
+
+def read_yolo(path):
+    with open(path, 'r') as f:
+        return parse_yolo(f.read())
+
+
+def format_yolo(boxes):
+    return (LINE_FORMAT * len(boxes)) % tuple(boxes.ravel().tolist())
+
+
+def write_yolo(path, boxes):
+    with open(path, 'w') as f:
+        f.write(format_yolo(boxes))
+
+
+#transforms
+def clip_boxes(boxes):
+    clipped = boxes.copy()
+    np.clip(clipped[:, 1:], 0, 1, out=clipped[:, 1:])
+    return clipped
+
+
+def crop_boxes(boxes, crop_left, crop_top, crop_right, crop_bottom, original_width, original_height):
+    new_width = original_width - crop_left - crop_right
+    new_height = original_height - crop_top - crop_bottom
+    x_center = boxes[:, 1] * original_width - crop_left
+    y_center = boxes[:, 2] * original_height - crop_top
+    # boxes whose center leaves the crop are dropped
+    keep = (x_center >= 0) & (y_center >= 0) & (x_center <= new_width) & (y_center <= new_height)
+
+    cropped = boxes[keep].copy()
+    cropped[:, 1] = x_center[keep] / new_width
+    cropped[:, 2] = y_center[keep] / new_height
+    cropped[:, 3] *= original_width / new_width
+    cropped[:, 4] *= original_height / new_height
+    return clip_boxes(cropped)
+
+
+def flip_boxes(boxes, horizontal, vertical):
+    flipped = boxes.copy()
+    if horizontal:
+        flipped[:, 1] = 1.0 - flipped[:, 1]
+    if vertical:
+        flipped[:, 2] = 1.0 - flipped[:, 2]
+    np.clip(flipped[:, 1:3], 0, 1, out=flipped[:, 1:3])
+    return flipped
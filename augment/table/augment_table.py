@@ -0,0 +1,130 @@
+import os
+import csv
+from collections import deque
+from itertools import chain
+from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from core.utils import get_current_time, get_parent_directory, get_basename, get_stem, get_suffix
+from core.utils import get_workers_count, allocate_version
+from augment.table.table_plan import load_table_plan
+from augment.table.processor_table import TableProcessor, chunk_rng, detect_columns
+
+
+class AugmentTableDataset():
+    def __init__(self, data_path=None, plan=None, output_path=None):
+        self.plan = plan if plan is not None else load_table_plan()
+        self.data_path = data_path if data_path is not None else self.plan.data_path
+        self.new_data_path = output_path if output_path is not None else self.create_new_table_path()
+        self.process_table()
+
+
+    # processing
+    def process_table(self):
+        workers = get_workers_count(self.plan.workers)
+        part_path = f"{self.new_data_path}.part"
+        try:
+            self.write_table(part_path, workers)
+        except BaseException:
+            # a failed run leaves no partial table behind
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        os.replace(part_path, self.new_data_path)
+        return self.new_data_path
+
+
+    def write_table(self, part_path, workers):
+        with open(self.data_path, 'rb') as source, open(part_path, 'wb') as output, \
+                tqdm(desc=f"Processing table {get_basename(self.data_path)}", unit='B', unit_scale=True,
+                     total=os.path.getsize(self.data_path)) as pbar:
+            header_line = source.readline()
+            pbar.update(len(header_line))
+            header = next(csv.reader([header_line.decode('utf-8')]))
+            lineterminator = '\r\n' if header_line.endswith(b'\r\n') else '\n'
+            output.write(header_line if header_line.endswith(b'\n') else header_line + lineterminator.encode())
+            chunks = iter_csv_chunks(source, self.plan.chunk_bytes)
+            first = next(chunks, None)
+            if first is not None:
+                # column types and line endings are decided on the first chunk, later chunks that do not fit fall back per column
+                layout = self.get_columns(header, first.decode('utf-8')) + (lineterminator,)
+                chunks = chain([first], chunks)
+                if workers > 1:
+                    results = self.process_parallel(chunks, header, layout, workers)
+                else:
+                    results = (process_table_chunk(index, data, header, layout, self.plan)
+                               for index, data in enumerate(chunks))
+                for index, (size, text, fallback_columns) in enumerate(results):
+                    if fallback_columns:
+                        tqdm.write(f"Chunk {index}: columns {fallback_columns} hold non-numeric values, "
+                                   f"treated as categorical in this chunk")
+                    output.write(text.encode('utf-8'))
+                    pbar.update(size)
+
+
+    def process_parallel(self, chunks, header, layout, workers):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for index, data in enumerate(chunks):
+                pending.append(executor.submit(process_table_chunk, index, data, header, layout, self.plan))
+                # chunks are written in input order; a bounded number in flight keeps memory flat
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+    def get_columns(self, header, text):
+        numeric, integer, categorical = detect_columns(header, text)
+        if self.plan.numeric_columns is not None:
+            numeric = list(self.plan.numeric_columns)
+            integer = [column for column in integer if column in numeric]
+        if self.plan.categorical_columns is not None:
+            categorical = list(self.plan.categorical_columns)
+        else:
+            categorical = [column for column in header if column not in numeric]
+        unknown = [column for column in numeric + categorical + [self.plan.target_column]
+                   if column is not None and column not in header]
+        if unknown:
+            raise ValueError(f"Columns {unknown} are not in the header of {self.data_path}")
+        return numeric, integer, categorical
+
+
+    # new table file
+    def create_new_table_path(self):
+        parent_dir = get_parent_directory(os.path.abspath(self.data_path))
+        basename = get_basename(self.data_path)
+        stem, suffix = get_stem(basename), get_suffix(basename)
+        version = allocate_version(parent_dir, stem)
+        return os.path.join(parent_dir, f"{stem}-V{version}-{get_current_time()}{suffix}")
+
+
+def iter_csv_chunks(file, chunk_bytes):
+    # about chunk_bytes of whole lines at a time, the last partial line is carried over
+    rest = b''
+    while True:
+        block = file.read(chunk_bytes)
+        if not block:
+            if rest:
+                yield rest
+            return
+        block = rest + block
+        cut = block.rfind(b'\n') + 1
+        if cut == 0:
+            rest = block
+            continue
+        rest = block[cut:]
+        yield block[:cut]
+
+
+def process_table_chunk(index, data, header, layout, plan):
+    text = data.decode('utf-8')
+    numeric, integer, categorical, lineterminator = layout
+    processor = TableProcessor(header, text, numeric, integer, categorical, target_column=plan.target_column,
+                               lineterminator=lineterminator)
+    if processor.size == 0:
+        return len(data), '', []
+    parts = []
+    for step in plan.augmentations:
+        rng = chunk_rng(plan.seed, index, step.name)
+        parts.append(getattr(processor, step.method)(rng=rng, **step.kwargs))
+    return len(data), ''.join(parts), processor.fallback_columns
@@ -0,0 +1,171 @@
+import warnings
+import numpy as np
+
+# the spatial index of scipy is used when it is installed, the NumPy leaf index otherwise
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# kd-tree pruning stops paying off above this many dimensions, the leaf search then scans blocks
+KD_TREE_MAX_DIMENSIONS = 16
+LEAF_SIZE = 64
+CANDIDATE_BLOCK = 1024
+
+
+#neighbour index
+def nearest_neighbors(points, k, use_scipy=True):
+    """
+    Indices (N, k) of the k nearest other points for every row of points, by euclidean distance.
+    k is reduced to N - 1 when there are fewer points.
+    """
+    count = len(points)
+    k = min(k, count - 1)
+    if k <= 0:
+        return np.zeros((count, 0), dtype=np.int64)
+    if use_scipy and cKDTree is not None and points.shape[1] <= KD_TREE_MAX_DIMENSIONS:
+        indices = cKDTree(points).query(points, k=k + 1)[1]
+        return _drop_self(indices, k)
+    return leaf_neighbors(points, k)
+
+
+def build_leaves(points, leaf_size=LEAF_SIZE):
+    # kd-tree leaves: median splits on the widest dimension until a node holds at most leaf_size points
+    leaves, stack = [], [np.arange(len(points))]
+    while stack:
+        node = stack.pop()
+        values = points[node]
+        spans = values.max(axis=0) - values.min(axis=0)
+        if len(node) <= leaf_size or not spans.any():
+            leaves.append(node)
+            continue
+        dimension = int(np.argmax(spans))
+        middle = len(node) // 2
+        order = np.argpartition(values[:, dimension], middle)
+        stack.append(node[order[middle:]])
+        stack.append(node[order[:middle]])
+    return leaves
+
+
+def leaf_neighbors(points, k, leaf_size=LEAF_SIZE):
+    """
+    Exact k nearest neighbours without scipy. The points of one kd-tree leaf are searched together:
+    first against their own leaf, then against the other leaves in order of box distance, in blocks
+    of about CANDIDATE_BLOCK points. Leaves farther from every query than its k-th neighbour so far are
+    skipped; in high dimensions few are and the search becomes a blocked brute force.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    leaves = build_leaves(points, max(leaf_size, k + 1))
+    lows = np.array([points[leaf].min(axis=0) for leaf in leaves])
+    highs = np.array([points[leaf].max(axis=0) for leaf in leaves])
+    norms = np.einsum('ij,ij->i', points, points)
+    result = np.empty((len(points), k), dtype=np.int64)
+    for position, queries in enumerate(leaves):
+        gaps = np.maximum(0, np.maximum(lows - highs[position], lows[position] - highs))
+        box_distances = np.einsum('ij,ij->i', gaps, gaps)
+        box_distances[position] = -1
+        order = np.argsort(box_distances, kind='stable')
+        best_distances = np.full((len(queries), k), np.inf)
+        best_indices = np.zeros((len(queries), k), dtype=np.int64)
+        query_points = points[queries]
+        start = 0
+        while start < len(order) and box_distances[order[start]] <= best_distances[:, -1].max():
+            # the own leaf goes alone and sets the first radii, then the next leaves by box distance
+            stop = start + 1 if start == 0 else min(start + max(CANDIDATE_BLOCK // leaf_size, 1), len(order))
+            group = order[start:stop]
+            if start > 0:
+                # a leaf is scanned only if its box is within the current k-th distance of some query
+                point_gaps = np.maximum(0, np.maximum(lows[group][None] - query_points[:, None],
+                                                      query_points[:, None] - highs[group][None]))
+                needed = (np.einsum('ijk,ijk->ij', point_gaps, point_gaps) <= best_distances[:, -1:]).any(axis=0)
+                group = group[needed]
+            start = stop
+            if not len(group):
+                continue
+            block = np.concatenate([leaves[i] for i in group])
+            distances = _squared_distances(points, norms, queries, block)
+            if group[0] == position:
+                np.fill_diagonal(distances, np.inf)
+            best_distances, best_indices = _merge_block(distances, block, best_distances, best_indices)
+        result[queries] = best_indices
+    return result
+
+
+def _merge_block(distances, block, best_distances, best_indices):
+    # only pairs closer than the current k-th neighbour can change the result
+    rows, columns = np.nonzero(distances < best_distances[:, -1:])
+    if not len(rows):
+        return best_distances, best_indices
+    count, k = best_distances.shape
+    all_rows = np.concatenate([np.repeat(np.arange(count), k), rows])
+    all_distances = np.concatenate([best_distances.ravel(), distances[rows, columns]])
+    all_indices = np.concatenate([best_indices.ravel(), block[columns]])
+    order = np.lexsort((all_distances, all_rows))
+    # every row keeps at least its k old entries, the first k of each row after sorting are the nearest
+    starts = np.searchsorted(all_rows[order], np.arange(count))
+    keep = order[starts[:, None] + np.arange(k)]
+    return all_distances[keep], all_indices[keep]
+
+
+def _squared_distances(points, norms, queries, candidates):
+    distances = points[queries] @ points[candidates].T
+    distances *= -2
+    distances += norms[queries][:, None]
+    distances += norms[candidates][None, :]
+    return np.maximum(distances, 0, out=distances)
+
+
+def _drop_self(indices, k):
+    # the point itself is usually the first hit, duplicates may put it further back
+    own = np.arange(len(indices))[:, None]
+    not_self = indices != own
+    not_self[not_self.sum(axis=1) > k, k] = False
+    return indices[not_self].reshape(len(indices), k)
+
+
+#smote
+def smote_samples(features, labels, k, ratio, rng, batch_size=65536, use_scipy=True):
+    """
+    SMOTE for every minority class: a synthetic row lies at gap * (partner - base) from a base row of the class,
+    partner is one of the base row's k nearest neighbours in the same class.
+    Classes get round((majority count - class count) * ratio) rows, drawn batch_size at a time.
+    Returns (base indices, partner indices, gaps), the caller interpolates the columns it needs.
+    """
+    scaled = standardize(features)
+    classes, counts = np.unique(labels, return_counts=True)
+    target = counts.max() if len(counts) else 0
+    bases, partners, gaps = [], [], []
+    for label, count in zip(classes, counts):
+        wanted = int(round((target - count) * ratio))
+        if wanted <= 0 or count < 2:
+            continue
+        members = np.flatnonzero(labels == label)
+        neighbors = nearest_neighbors(scaled[members], k, use_scipy=use_scipy)
+        for base, partner, gap in draw_samples(members, neighbors, wanted, rng, batch_size):
+            bases.append(base)
+            partners.append(partner)
+            gaps.append(gap)
+    if not bases:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(bases), np.concatenate(partners), np.concatenate(gaps)
+
+
+def draw_samples(members, neighbors, wanted, rng, batch_size=65536):
+    # (base indices, partner indices, gaps) batches for one class, neighbors index into members
+    for start in range(0, wanted, batch_size):
+        size = min(batch_size, wanted - start)
+        base = rng.integers(0, len(members), size)
+        partner = neighbors[base, rng.integers(0, neighbors.shape[1], size)]
+        yield members[base], members[partner], rng.random(size)
+
+
+def standardize(features):
+    # distances on z-scores, so no column dominates by its units; missing values sit at the mean
+    features = np.asarray(features, dtype=np.float64)
+    with warnings.catch_warnings():
+        # columns without any value are all missing, they end up as zeros
+        warnings.simplefilter('ignore', RuntimeWarning)
+        means = np.nan_to_num(np.nanmean(features, axis=0))
+        stds = np.nan_to_num(np.nanstd(features, axis=0))
+    stds[stds == 0] = 1
+    return np.nan_to_num((features - means) / stds)
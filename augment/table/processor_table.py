@@ -0,0 +1,189 @@
+import io
+import csv
+import hashlib
+import numpy as np
+from augment.table.oversampling import smote_samples
+
+# operation name -> (TableProcessor method, config parameters bound to it)
+OPERATIONS = {
+    'basic': ('basic_rows', ()),
+    'gaussian_noise': ('gaussian_noise_rows', ('noise_scale',)),
+    'uniform_noise': ('uniform_noise_rows', ('noise_scale',)),
+    'bootstrap': ('bootstrap_rows', ('bootstrap_fraction',)),
+    'categorical_swap': ('categorical_swap_rows', ('swap_probability',)),
+    'scaling': ('scaling_rows', ('scale_limit',)),
+    'smote': ('smote_rows', ('smote_neighbors', 'smote_ratio')),
+}
+
+# operations that need target_column
+TARGET_OPERATIONS = ('smote',)
+
+
+def chunk_rng(seed, chunk_index, operation):
+    # draws depend on the chunk position only, not on the worker that gets it
+    key = f"{seed}:{chunk_index}:{operation}".encode()
+    return np.random.default_rng(int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little'))
+
+
+#columns
+def parse_numeric(values, column):
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        pass
+    # empty cells are missing values, anything else that is not a number is an error
+    try:
+        return np.array([value if value.strip() else 'nan' for value in values], dtype=np.float64)
+    except ValueError as e:
+        raise ValueError(f"Column '{column}' is numeric but holds a non-numeric value: {e}") from None
+
+
+def format_numeric(values, integer):
+    if integer:
+        text = np.char.mod('%d', np.rint(np.nan_to_num(values)).astype(np.int64))
+    else:
+        text = np.char.mod('%.10g', values)
+    # missing values go back out as empty cells
+    text[np.isnan(values)] = ''
+    return text
+
+
+def detect_columns(header, text):
+    """
+    Sorts the columns of a CSV sample into numeric, integer and categorical ones.
+    A column is numeric when it has values and every non-empty cell of the sample parses as a float.
+    """
+    rows = list(csv.reader(io.StringIO(text)))
+    numeric, integer, categorical = [], [], []
+    for position, column in enumerate(header):
+        values = [row[position] for row in rows if position < len(row) and row[position].strip()]
+        if not values:
+            # nothing to go by, text is the type every later value fits
+            categorical.append(column)
+            continue
+        try:
+            parsed = np.array(values, dtype=np.float64)
+        except ValueError:
+            categorical.append(column)
+            continue
+        numeric.append(column)
+        if np.all(np.isfinite(parsed)) and np.all(parsed == np.rint(parsed)) \
+                and all('.' not in value and 'e' not in value.lower() for value in values):
+            integer.append(column)
+    return numeric, integer, categorical
+
+
+class TableProcessor:
+    """
+    One chunk of CSV rows split into columns. Every operation returns new CSV text for the chunk,
+    numeric columns are float64 arrays and categorical columns arrays of strings.
+    """
+    def __init__(self, header, text, numeric_columns, integer_columns, categorical_columns, target_column=None,
+                 lineterminator='\n'):
+        self.header = header
+        self.text = text
+        # augmented rows end like the source lines
+        self.lineterminator = lineterminator
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+        for row in rows:
+            if len(row) != len(header):
+                raise ValueError(f"CSV row has {len(row)} fields, the header has {len(header)}; "
+                                 f"quoted line breaks are not supported")
+        self.size = len(rows)
+        self.target_column = target_column
+        self.integer_columns = set(integer_columns)
+        self.columns = {}
+        # numeric columns with text in this chunk are treated as categorical here
+        self.fallback_columns = []
+        cells = list(zip(*rows)) if rows else [()] * len(header)
+        for column, values in zip(header, cells):
+            if column in numeric_columns:
+                try:
+                    self.columns[column] = parse_numeric(values, column)
+                    continue
+                except ValueError:
+                    self.fallback_columns.append(column)
+            self.columns[column] = np.array(values, dtype=str)
+        # the target is never changed, it is what the augmented rows are labeled with
+        self.numeric_columns = [column for column in numeric_columns
+                                if column != target_column and column not in self.fallback_columns]
+        self.categorical_columns = [column for column in list(categorical_columns) + self.fallback_columns
+                                    if column != target_column]
+
+
+    #operations
+    def basic_rows(self, rng, **kwargs):
+        # the source lines as they are, nothing to parse or format
+        return self.text if self.text.endswith('\n') else self.text + self.lineterminator
+
+
+    def gaussian_noise_rows(self, rng, noise_scale, **kwargs):
+        columns = dict(self.columns)
+        for column in self.numeric_columns:
+            values = columns[column]
+            columns[column] = values + rng.normal(0.0, 1.0, self.size) * (noise_scale * self._get_std(values))
+        return self.format_rows(columns)
+
+
+    def uniform_noise_rows(self, rng, noise_scale, **kwargs):
+        columns = dict(self.columns)
+        for column in self.numeric_columns:
+            values = columns[column]
+            limit = noise_scale * self._get_std(values)
+            columns[column] = values + rng.uniform(-limit, limit, self.size)
+        return self.format_rows(columns)
+
+
+    def bootstrap_rows(self, rng, bootstrap_fraction, **kwargs):
+        picks = rng.integers(0, self.size, int(round(self.size * bootstrap_fraction))) if self.size else []
+        return self.format_rows({column: values[picks] for column, values in self.columns.items()})
+
+
+    def categorical_swap_rows(self, rng, swap_probability, **kwargs):
+        # a swapped cell takes the value of another row, the column keeps its distribution
+        columns = dict(self.columns)
+        for column in self.categorical_columns:
+            values = columns[column].copy()
+            swapped = rng.random(self.size) < swap_probability
+            values[swapped] = columns[column][rng.integers(0, self.size, int(swapped.sum()))]
+            columns[column] = values
+        return self.format_rows(columns)
+
+
+    def scaling_rows(self, rng, scale_limit, **kwargs):
+        columns = dict(self.columns)
+        for column in self.numeric_columns:
+            columns[column] = columns[column] * rng.uniform(1 - scale_limit, 1 + scale_limit)
+        return self.format_rows(columns)
+
+
+    def smote_rows(self, rng, smote_neighbors, smote_ratio, **kwargs):
+        # only the synthetic minority rows, categorical cells are taken from the base row
+        if not self.numeric_columns:
+            raise ValueError("smote needs at least one numeric column besides the target")
+        features = np.column_stack([self.columns[column] for column in self.numeric_columns])
+        bases, partners, gaps = smote_samples(features, self.columns[self.target_column],
+                                              k=smote_neighbors, ratio=smote_ratio, rng=rng)
+        columns = {column: values[bases] for column, values in self.columns.items()}
+        for column in self.numeric_columns:
+            values = self.columns[column]
+            columns[column] = values[bases] + gaps * (values[partners] - values[bases])
+        return self.format_rows(columns)
+
+
+    #save
+    def format_rows(self, columns):
+        cells = []
+        for column in self.header:
+            values = columns[column]
+            if values.dtype.kind == 'f':
+                values = format_numeric(values, column in self.integer_columns)
+            cells.append(values.tolist())
+        output = io.StringIO()
+        csv.writer(output, lineterminator=self.lineterminator).writerows(zip(*cells))
+        return output.getvalue()
+
+
+    def _get_std(self, values):
+        std = np.nanstd(values) if np.any(np.isfinite(values)) else 0.0
+        return std if np.isfinite(std) else 0.0
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from core.config_data import open_config, table_path
+from augment.images.pipeline_plan import PlanStep
+from augment.table.processor_table import OPERATIONS, TARGET_OPERATIONS
+
+
+@dataclass(frozen=True)
+class TablePlan:
+    data_path: str
+    augmentations: tuple
+    numeric_columns: tuple = None
+    categorical_columns: tuple = None
+    target_column: str = None
+    seed: int = 0
+    workers: int = 1
+    chunk_size_mb: float = 64
+
+    @classmethod
+    def from_config(cls, config_data):
+        chunk_size_mb = float(config_data.get("chunk_size_mb", 64))
+        if chunk_size_mb <= 0:
+            raise ValueError(f"chunk_size_mb must be positive, got {chunk_size_mb}")
+        numeric_columns = config_data.get("numeric_columns")
+        categorical_columns = config_data.get("categorical_columns")
+        augmentations = compile_steps(config_data.get("augmentations") or [], config_data)
+        needs_target = [step.name for step in augmentations if step.name in TARGET_OPERATIONS]
+        if needs_target and config_data.get("target_column") is None:
+            raise ValueError(f"Operations {needs_target} need target_column")
+        return cls(data_path=config_data.get("data_path"),
+                   augmentations=augmentations,
+                   numeric_columns=tuple(numeric_columns) if numeric_columns is not None else None,
+                   categorical_columns=tuple(categorical_columns) if categorical_columns is not None else None,
+                   target_column=config_data.get("target_column"),
+                   seed=int(config_data.get("seed", 0) or 0),
+                   workers=int(config_data.get("workers", 1) or 0),
+                   chunk_size_mb=chunk_size_mb)
+
+    @property
+    def chunk_bytes(self):
+        return int(self.chunk_size_mb * 1024 * 1024)
+
+
+def compile_steps(names, config_data):
+    steps = []
+    for name in names:
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown table operation '{name}', expected one of {sorted(OPERATIONS)}")
+        method, param_names = OPERATIONS[name]
+        missing = [param for param in param_names if param not in config_data]
+        if missing:
+            raise ValueError(f"Operation '{name}' requires config parameters {missing}")
+        params = tuple((param, config_data[param]) for param in param_names)
+        steps.append(PlanStep(name=name, method=method, params=params))
+    return tuple(steps)
+
+
+def load_table_plan(config_path=table_path):
+    return TablePlan.from_config(open_config(config_path))
@@ -0,0 +1,70 @@
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from augment.table.oversampling import cKDTree, nearest_neighbors, draw_samples, standardize
+from benchmarks.run_benchmark import get_peak_rss_mb
+
+
+def generate_table(rows, features, minority_fraction, seed=0):
+    # two gaussian blobs, the minority class shifted by one standard deviation
+    rng = np.random.default_rng(seed)
+    labels = (rng.random(rows) < minority_fraction).astype(np.int64)
+    points = rng.normal(size=(rows, features)) + labels[:, None]
+    return points, labels
+
+
+def run_benchmark(rows=1_000_000, features=8, minority_fraction=0.1, k=5, ratio=1.0, batch_size=65536,
+                  use_scipy=True, seed=0):
+    points, labels = generate_table(rows, features, minority_fraction, seed)
+    members = np.flatnonzero(labels == 1)
+    minority = standardize(points[members])
+
+    start = time.perf_counter()
+    neighbors = nearest_neighbors(minority, k, use_scipy=use_scipy)
+    index_seconds = time.perf_counter() - start
+
+    # generation alone, on the neighbours built above
+    wanted = int(round((rows - 2 * len(members)) * ratio))
+    synthetic_rows = 0
+    start = time.perf_counter()
+    for bases, partners, gaps in draw_samples(members, neighbors, max(wanted, 0), np.random.default_rng(seed),
+                                              batch_size):
+        synthetic = points[bases] + gaps[:, None] * (points[partners] - points[bases])
+        synthetic_rows += len(synthetic)
+    smote_seconds = time.perf_counter() - start
+    return {'table': {'rows': rows, 'features': features, 'minority_rows': len(minority)},
+            'index': 'scipy cKDTree' if use_scipy and cKDTree is not None and features <= 16 else 'numpy leaves',
+            'neighbors': {'seconds': index_seconds, 'rows_per_s': len(minority) / index_seconds},
+            'smote': {'synthetic_rows': synthetic_rows, 'seconds': smote_seconds,
+                      'synthetic_rows_per_s': synthetic_rows / smote_seconds if smote_seconds else 0.0},
+            'peak_rss_mb': get_peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SMOTE oversampling on a synthetic imbalanced table")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--features', type=int, default=8)
+    parser.add_argument('--minority-fraction', dest='minority_fraction', type=float, default=0.1)
+    parser.add_argument('--neighbors', type=int, default=5)
+    parser.add_argument('--ratio', type=float, default=1.0)
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=65536)
+    parser.add_argument('--no-scipy', dest='use_scipy', action='store_false',
+                        help="use the NumPy leaf index even when scipy is installed")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON report path (default: stdout)")
+    args = parser.parse_args()
+    report = run_benchmark(rows=args.rows, features=args.features, minority_fraction=args.minority_fraction,
+                           k=args.neighbors, ratio=args.ratio, batch_size=args.batch_size,
+                           use_scipy=args.use_scipy, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import dataclasses
+from pathlib import Path
+from collections import defaultdict
+import cv2
+import numpy as np
+from core.config_data import open_config, image_path
+from core.utils import get_stem
+from augment.images.augment_image import AugmentImageDataset
+from augment.images.pipeline_plan import PipelinePlan
+from augment.images.processor_image import ImageProcessor
+from augment.images.image_header import read_image_size
+from augment.images.dataset_scanner import find_splits, iter_split_pairs
+from augment.images.yolo_boxes import write_yolo
+from benchmarks.synthetic_dataset import generate_dataset
+
+
+class CaptureWriter:
+    # keeps outputs in memory so augmentations are timed without encoding and disk writes
+    def __init__(self):
+        self.images = []
+        self.annotations = []
+
+    def write_image(self, path, image):
+        self.images.append((path, image))
+
+    def write_annotation(self, path, boxes):
+        self.annotations.append((path, boxes))
+
+
+def get_percentiles(values):
+    values = np.asarray(values) * 1000
+    return {'count': int(values.size), 'mean_ms': float(values.mean()),
+            'p50_ms': float(np.percentile(values, 50)), 'p90_ms': float(np.percentile(values, 90)),
+            'p99_ms': float(np.percentile(values, 99)), 'max_ms': float(values.max())}
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; children covers the process pool workers
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'main': own / 1024, 'workers': children / 1024}
+
+
+def count_outputs(dataset_path):
+    images = labels = 0
+    for split_path in find_splits(dataset_path):
+        images += len(os.listdir(os.path.join(split_path, 'images')))
+        labels += len(os.listdir(os.path.join(split_path, 'labels')))
+    return images, labels
+
+
+def benchmark_end_to_end(plan, data_path):
+    start = time.perf_counter()
+    dataset = AugmentImageDataset(data_path=data_path, classes_path=None, plan=plan)
+    elapsed = time.perf_counter() - start
+    pairs = sum(1 for split_path in find_splits(data_path) for pair in iter_split_pairs(split_path, False))
+    images, labels = count_outputs(dataset.new_data_path)
+    shutil.rmtree(dataset.new_data_path)
+    return {'seconds': elapsed, 'pairs': pairs, 'output_images': images, 'output_labels': labels,
+            'pairs_per_sec': pairs / elapsed, 'output_images_per_sec': images / elapsed}
+
+
+def benchmark_stages(plan, data_path, samples, scratch_path):
+    timings = defaultdict(list)
+    pairs = [pair for split_path in find_splits(data_path) for pair in iter_split_pairs(split_path, False)]
+    for image_file, label_file in pairs[:samples]:
+        writer = CaptureWriter()
+
+        start = time.perf_counter()
+        source_size = read_image_size(image_file) if plan.decode_resize is not None else None
+        decode_scale = plan.decode_scale(*source_size) if source_size else 1
+        ip = ImageProcessor(image_path=image_file, annotation_path=label_file,
+                            save_image_path=scratch_path, save_annotation_path=scratch_path,
+                            decode_scale=decode_scale, source_size=source_size if decode_scale > 1 else None,
+                            writer=writer)
+        # the processor decodes lazily, the first access is the decode
+        ip.image
+        timings['decode'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ip.ap.annotation
+        timings['label_read'].append(time.perf_counter() - start)
+
+        for step in plan.preprocessing:
+            start = time.perf_counter()
+            getattr(ip, step.method)(preprocess=True, **step.kwargs)
+            timings[f'preprocess:{step.name}'].append(time.perf_counter() - start)
+        for step in plan.augmentations:
+            start = time.perf_counter()
+            getattr(ip, step.method)(preprocess=False, **step.kwargs)
+            timings[f'augment:{step.name}'].append(time.perf_counter() - start)
+
+        for path, image in writer.images:
+            start = time.perf_counter()
+            cv2.imencode(os.path.splitext(str(path))[1], image)
+            timings['encode'].append(time.perf_counter() - start)
+        for path, boxes in writer.annotations:
+            start = time.perf_counter()
+            write_yolo(os.path.join(scratch_path, get_stem(os.path.basename(path)) + '.txt'), boxes)
+            timings['label_write'].append(time.perf_counter() - start)
+    return {stage: get_percentiles(values) for stage, values in timings.items()}
+
+
+def run_benchmark(config_path=image_path, files=100, width=1920, height=1080, boxes=10,
+                  workers=None, samples=20, seed=0):
+    config_data = open_config(config_path)
+    if workers is not None:
+        config_data['workers'] = workers
+    work_path = tempfile.mkdtemp(prefix='augmentx-bench-')
+    try:
+        data_path = generate_dataset(os.path.join(work_path, 'synthetic'), files=files, width=width,
+                                     height=height, boxes=boxes, seed=seed)
+        plan = dataclasses.replace(PipelinePlan.from_config(config_data), data_path=data_path)
+        scratch_path = Path(work_path) / 'scratch'
+        os.makedirs(scratch_path)
+        report = {
+            'dataset': {'files': files, 'width': width, 'height': height, 'boxes_per_image': boxes},
+            'plan': {'preprocessing': [step.name for step in plan.preprocessing],
+                     'augmentations': [step.name for step in plan.augmentations],
+                     'workers': plan.workers},
+            'end_to_end': benchmark_end_to_end(plan, data_path),
+            'stages': benchmark_stages(plan, data_path, samples, scratch_path),
+        }
+        report['peak_rss_mb'] = get_peak_rss_mb()
+        return report
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Augment-X on a synthetic YOLO dataset")
+    parser.add_argument('--config', default=str(image_path))
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--boxes', type=int, default=10, help="mean number of boxes per image")
+    parser.add_argument('--workers', type=int, default=None, help="overrides workers from the config")
+    parser.add_argument('--samples', type=int, default=20, help="pairs timed stage by stage")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON report path (default: stdout)")
+    args = parser.parse_args()
+    report = run_benchmark(config_path=args.config, files=args.files, width=args.width, height=args.height,
+                           boxes=args.boxes, workers=args.workers, samples=args.samples, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import argparse
+import cv2
+import numpy as np
+from augment.images.yolo_boxes import write_yolo
+
+
+def generate_image(rng, width, height):
+    # smooth noise compresses like a photo, pure noise would make JPEG sizes meaningless
+    small = rng.integers(0, 256, (max(height // 16, 1), max(width // 16, 1), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(-8, 9, image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def generate_boxes(rng, count, classes):
+    boxes = np.empty((count, 5), dtype=np.float32)
+    boxes[:, 0] = rng.integers(0, classes, count)
+    boxes[:, 3:5] = rng.uniform(0.01, 0.2, (count, 2))
+    boxes[:, 1:3] = rng.uniform(boxes[:, 3:5] / 2, 1 - boxes[:, 3:5] / 2)
+    return boxes
+
+
+def generate_dataset(root, files=100, width=1920, height=1080, boxes=10, classes=3,
+                     splits=('train', 'valid'), extension='.jpg', seed=0):
+    """
+    Creates <root>/<split>/images and <root>/<split>/labels with random images and YOLO boxes.
+    The box count per image is drawn around `boxes`, files are spread evenly over the splits.
+    """
+    rng = np.random.default_rng(seed)
+    for index in range(files):
+        split = splits[index % len(splits)]
+        images_path = os.path.join(root, split, 'images')
+        labels_path = os.path.join(root, split, 'labels')
+        os.makedirs(images_path, exist_ok=True)
+        os.makedirs(labels_path, exist_ok=True)
+        name = f"synthetic_{index:07d}"
+        cv2.imwrite(os.path.join(images_path, name + extension), generate_image(rng, width, height))
+        write_yolo(os.path.join(labels_path, name + '.txt'),
+                   generate_boxes(rng, int(rng.poisson(boxes)), classes))
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic YOLO dataset")
+    parser.add_argument('root')
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--boxes', type=int, default=10, help="mean number of boxes per image")
+    parser.add_argument('--classes', type=int, default=3)
+    parser.add_argument('--extension', default='.jpg')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_dataset(args.root, files=args.files, width=args.width, height=args.height, boxes=args.boxes,
+                     classes=args.classes, extension=args.extension, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
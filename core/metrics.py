@@ -0,0 +1,156 @@
+import os
+import time
+import json
+import bisect
+import threading
+from functools import wraps
+import numpy as np
+
+# histogram upper bounds in seconds: 10us doubling up to ~84s, then +Inf
+BUCKETS = tuple(1e-5 * 2 ** i for i in range(24)) + (float('inf'),)
+
+
+class Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+    #record
+    def timer(self, name):
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+
+    def timed(self, name):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Timer(self, name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+    def add(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            histogram['buckets'][bisect.bisect_left(BUCKETS, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+
+    #merge between processes
+    def collect(self):
+        with self.lock:
+            snapshot = {'counters': self.counters, 'histograms': self.histograms}
+            self.counters, self.histograms = {}, {}
+        return snapshot
+
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, other in snapshot['histograms'].items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    self.histograms[name] = {'buckets': list(other['buckets']), 'sum': other['sum'],
+                                             'count': other['count']}
+                    continue
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+                histogram['sum'] += other['sum']
+                histogram['count'] += other['count']
+
+
+    #export
+    def summary(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: self._summarize(histogram) for name, histogram in self.histograms.items()}
+        return {'counters': counters, 'timers': histograms}
+
+
+    def to_prometheus(self, prefix='augmentx'):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f"{metric}_sum {histogram['sum']}")
+                lines.append(f"{metric}_count {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+    def write_prometheus(self, path):
+        # written aside and renamed, so the node exporter never reads a half written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+    def write_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+    def _summarize(self, histogram):
+        count = histogram['count']
+        summary = {'count': count, 'total_s': histogram['sum'], 'mean_ms': histogram['sum'] / count * 1000 if count else 0.0}
+        cumulative = np.cumsum(histogram['buckets'])
+        for quantile in (50, 90, 99):
+            # upper bound of the bucket that holds the quantile
+            index = int(np.searchsorted(cumulative, count * quantile / 100))
+            bound = BUCKETS[min(index, len(BUCKETS) - 2)]
+            summary[f'p{quantile}_ms'] = bound * 1000
+        return summary
+
+
+metrics = Metrics()
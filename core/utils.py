@@ -1,4 +1,6 @@
 import os
+import re
+import hashlib
 from datetime import datetime
 from pathlib import Path
 
@@ -25,16 +27,6 @@ def get_parent_directory(path):
     return parent_dir
 
 
-def count_similar_folders(path, folder_name):
-    folder_name_lower = folder_name.lower()
-    count = 0
-    for root, dirs, files in os.walk(path):
-        for dir_name in dirs:
-            if folder_name_lower in dir_name.lower():
-                count += 1
-    return count
-
-
 def get_basename(path):
     """
     Возвращает базовое имя директории path.
@@ -43,18 +35,6 @@ def get_basename(path):
     return base_name
 
 
-def replicate_directory_structure(old_dir_path, new_dir_path):
-    """
-    Воспроизводит структуру поддиректорий из data_path внутри new_dir_path.
-    """
-    for root, dirs, files in os.walk(old_dir_path):
-        rel_path = os.path.relpath(root, old_dir_path)
-        target_dir = os.path.join(new_dir_path, rel_path)
-        for d in dirs:
-            dir_path = os.path.join(target_dir, d)
-            os.makedirs(dir_path, exist_ok=True)
-
-
 def get_stem(basename):
     return Path(basename).stem
 
@@ -65,4 +45,77 @@ def get_suffix(basename):
 def set_new_filename(stem, augmentation, suffix):
     return f"{stem}_{augmentation}{suffix}"
 
-           
\ No newline at end of file
+
+def get_workers_count(workers):
+    """
+    Возвращает число процессов: 0 или None означает все доступные ядра.
+    """
+    if not workers:
+        return os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def split_into_chunks(items, chunk_size):
+    """
+    Разбивает последовательность items на списки длиной не больше chunk_size.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def hash_files(paths):
+    """
+    Возвращает хэш содержимого файлов paths.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_folder_versions(path, folder_name):
+    """
+    Возвращает {номер версии: путь} для папок folder_name-V<n>-... в path (без рекурсии).
+    """
+    pattern = re.compile(rf"^{re.escape(folder_name)}-V(\d+)-")
+    versions = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            match = pattern.match(entry.name)
+            if match and entry.is_dir():
+                versions[int(match.group(1))] = entry.path
+    return versions
+
+
+def find_latest_version_folder(path, folder_name):
+    """
+    Возвращает путь к папке folder_name-V<n>-... с наибольшим n или None.
+    """
+    versions = get_folder_versions(path, folder_name)
+    return versions[max(versions)] if versions else None
+
+
+def allocate_version(path, folder_name):
+    """
+    Резервирует следующий номер версии folder_name в path.
+    Номер занимается атомарным созданием файла в .<folder_name>-versions, поэтому параллельные запуски не получат одну версию.
+    """
+    registry = os.path.join(path, f".{folder_name}-versions")
+    os.makedirs(registry, exist_ok=True)
+    reserved = [int(name) for name in os.listdir(registry) if name.isdigit()]
+    version = max(reserved + list(get_folder_versions(path, folder_name)), default=0) + 1
+    while True:
+        try:
+            os.close(os.open(os.path.join(registry, str(version)), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return version
+        except FileExistsError:
+            version += 1
@@ -1,13 +1,40 @@
+import json
+import argparse
 from augment.images.augment_image import AugmentImageDataset
-from core.config_data import get_data_type, get_data_path, get_classes_path
+from augment.images.pipeline_plan import load_image_plan
+from augment.images.dry_run import estimate_run
+from augment.table.augment_table import AugmentTableDataset
+from augment.table.table_plan import load_table_plan
+from core.config_data import get_data_type
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Augment-X dataset augmentation")
+    parser.add_argument('--incremental', '--resume', dest='incremental', action='store_true',
+                        help="process only new or changed pairs into an existing output version")
+    parser.add_argument('--output', default=None,
+                        help="output version folder for --incremental (default: the latest version)")
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help="estimate output files, disk space and run time without writing the dataset")
+    parser.add_argument('--dry-run-sample', dest='dry_run_sample', type=int, default=8,
+                        help="pairs the dry run times the plan on (default: 8)")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     data_type = get_data_type()
     if data_type == "images":
-        aid = AugmentImageDataset(data_path=get_data_path(), classes_path=get_classes_path())
+        plan = load_image_plan()
+        if args.dry_run:
+            print(json.dumps(estimate_run(plan=plan, sample_size=args.dry_run_sample), indent=2))
+            return
+        aid = AugmentImageDataset(data_path=plan.data_path, classes_path=plan.classes_path, plan=plan,
+                                  output_path=args.output, incremental=args.incremental)
+    elif data_type == "table":
+        AugmentTableDataset(plan=load_table_plan())
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()